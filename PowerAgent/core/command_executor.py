@@ -3,30 +3,214 @@
 
 """
 Handles the execution of shell commands, including 'cd'.
-Reads stdout/stderr *after* the process completes (NO LIVE STREAMING).
+On Linux/macOS stdout/stderr are streamed live through a single-thread selector pump.
+On Windows (where anonymous pipes cannot be polled) each pipe is streamed by a pooled reader.
 """
 
 import subprocess
 import os
+import signal
 import platform
 import base64
-import traceback
-import time
 import io
+import functools
 import logging # Import logging
-from typing import Callable, List
-from PySide6.QtCore import QThread, Signal, QObject
+from typing import Callable
+from PySide6.QtCore import Signal, QObject
 
 # Import utility using relative path
 try:
-    from .worker_utils import decode_output
+    from .worker_utils import IS_WINDOWS
 except ImportError:
     logging.error("Failed to import .worker_utils in command_executor.", exc_info=True)
-    def decode_output(b): return repr(b) # Fallback
+    IS_WINDOWS = platform.system() == "Windows"
+
+try:
+    from .stream_handler import ProcessStreamPump, PipeReader
+except ImportError:
+    logging.error("Failed to import .stream_handler in command_executor. Live output streaming disabled.", exc_info=True)
+    ProcessStreamPump = None; PipeReader = None
 
 # --- Get Logger ---
 logger = logging.getLogger(__name__)
 
+_WAIT_POLL_TIMEOUT = 0.1 # Seconds between stop flag checks while waiting for the process to exit
+_ERROR_PREFIX = b"Error: " # Pre-encoded prefix for executor error messages
+_EXIT_CODE_ERROR = _ERROR_PREFIX + b"Command exited with code: %d" # Fixed-shape message, formatted as bytes without encoding
+_HOME = os.path.expanduser("~") # Target of a bare 'cd' / 'cd ~'
+_STOP_WAIT_TIMEOUT = 2 # Seconds to wait for a killed process to exit when the user stops a command
+_READER_DRAIN_TIMEOUT = 10 # Seconds to wait for pooled readers to hit EOF once the process is gone
+_STDERR_TAIL_BYTES = 4096 # Streamed stderr kept for the exit code check; an "exited with code N" line comes last
+
+# --- PowerShell Wrapper ---
+# Only the user command varies, so the wrapper halves are encoded to UTF-16LE once.
+_PS_PREFIX = "$ProgressPreference = 'SilentlyContinue'; try { ".encode('utf-16le')
+_PS_SUFFIX = " } catch { Write-Error $_; exit 1 }".encode('utf-16le')
+
+# -NoProfile keeps startup lean; -NonInteractive makes prompts fail fast instead of waiting on a stdin nobody writes to
+_PS_BASE_ARGS = ("powershell.exe", "-NoLogo", "-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass", "-EncodedCommand")
+# The prefix is a whole number of 3-byte base64 groups, so its base64 text is also fixed and can be joined as-is.
+_PS_PREFIX_B64 = base64.b64encode(_PS_PREFIX).decode('ascii') if len(_PS_PREFIX) % 3 == 0 else None
+
+@functools.lru_cache(maxsize=128)
+def _encode_ps_command(command: str) -> str:
+    """
+    Wraps the command to suppress progress output and surface errors, then encodes it for -EncodedCommand.
+    Memoized: agent loops and CLI history re-run the same commands, and the result depends only on the text.
+    """
+    if _PS_PREFIX_B64 is not None: return _PS_PREFIX_B64 + base64.b64encode(command.encode('utf-16le') + _PS_SUFFIX).decode('ascii')
+    return base64.b64encode(_PS_PREFIX + command.encode('utf-16le') + _PS_SUFFIX).decode('ascii')
+
+# --- Launch Arguments ---
+# The platform and the app's environment do not change while it runs, so the launcher is chosen once at import.
+_SHELL_PATH = os.environ.get("SHELL", "/bin/sh")
+_POSIX_PREEXEC_FN = getattr(os, 'setsid', None) # New session, so a stop can kill the whole process group
+_WINDOWS_CREATION_FLAGS = (subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP) if IS_WINDOWS else 0
+
+def _build_windows_run_args(command: str) -> tuple[list[str], int, Callable | None]:
+    """PowerShell with the wrapped command passed via -EncodedCommand. Returns (run_args, creationflags, preexec_fn)."""
+    return [*_PS_BASE_ARGS, _encode_ps_command(command)], _WINDOWS_CREATION_FLAGS, None
+
+def _build_posix_run_args(command: str) -> tuple[list[str], int, Callable | None]:
+    """The user's shell running the command string. Returns (run_args, creationflags, preexec_fn)."""
+    return [_SHELL_PATH, "-c", command], 0, _POSIX_PREEXEC_FN
+
+_build_run_args = _build_windows_run_args if IS_WINDOWS else _build_posix_run_args
+if not IS_WINDOWS and _POSIX_PREEXEC_FN is None: logger.warning("os.setsid not available on this platform. Stop will only kill the shell process.")
+
+# --- Windows Job Objects ---
+# Each Windows command is placed in its own Job Object so a stop request can end the whole tree
+# with TerminateJobObject instead of launching taskkill.exe. KILL_ON_JOB_CLOSE is deliberately
+# not set: closing the job after a normal exit must not kill programs the command started.
+JOB_OBJECTS_AVAILABLE = False
+if IS_WINDOWS:
+    try:
+        import ctypes
+        from ctypes import wintypes
+        _kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        _kernel32.CreateJobObjectW.argtypes = (wintypes.LPVOID, wintypes.LPCWSTR); _kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+        _kernel32.AssignProcessToJobObject.argtypes = (wintypes.HANDLE, wintypes.HANDLE); _kernel32.AssignProcessToJobObject.restype = wintypes.BOOL
+        _kernel32.TerminateJobObject.argtypes = (wintypes.HANDLE, wintypes.UINT); _kernel32.TerminateJobObject.restype = wintypes.BOOL
+        _kernel32.CloseHandle.argtypes = (wintypes.HANDLE,); _kernel32.CloseHandle.restype = wintypes.BOOL
+        JOB_OBJECTS_AVAILABLE = True
+        logger.debug("Windows Job Object API available for process tree termination.")
+    except Exception as e:
+        logger.warning(f"Windows Job Object API unavailable, falling back to taskkill: {e}")
+
+def _assign_job_object(process: subprocess.Popen) -> int | None:
+    """Creates a Job Object and assigns the process to it. Returns the job handle, or None on failure."""
+    if not JOB_OBJECTS_AVAILABLE: return None
+    job_handle = _kernel32.CreateJobObjectW(None, None)
+    if not job_handle:
+        logger.warning(f"CreateJobObjectW failed (WinError {ctypes.get_last_error()}). Stop will use taskkill.")
+        return None
+    if not _kernel32.AssignProcessToJobObject(job_handle, int(process._handle)):
+        logger.warning(f"AssignProcessToJobObject failed for PID {process.pid} (WinError {ctypes.get_last_error()}). Stop will use taskkill.")
+        _kernel32.CloseHandle(job_handle)
+        return None
+    logger.debug(f"PID {process.pid} assigned to Job Object.")
+    return job_handle
+
+def _close_job_object(job_handle: int | None):
+    """Releases the job handle. Processes still in the job keep running."""
+    if job_handle:
+        try: _kernel32.CloseHandle(job_handle)
+        except Exception as e: logger.debug(f"Error closing Job Object handle: {e}")
+
+def _kill_process_tree(process_pid: int, job_handle: int | None = None):
+    """Forcefully terminates the process and its children. Logs the outcome."""
+    try:
+        if IS_WINDOWS:
+            if job_handle:
+                if _kernel32.TerminateJobObject(job_handle, 1):
+                    logger.info(f"Process {process_pid} tree terminated via TerminateJobObject."); return
+                logger.warning(f"TerminateJobObject failed for PID {process_pid} (WinError {ctypes.get_last_error()}). Falling back to taskkill.")
+            kill_cmd = ['taskkill', '/PID', str(process_pid), '/T', '/F']; kill_flags = subprocess.CREATE_NO_WINDOW
+            logger.debug(f"Attempting Windows termination: {kill_cmd}")
+            result = subprocess.run(kill_cmd, check=False, capture_output=True, creationflags=kill_flags, timeout=5)
+            if result.returncode == 0: logger.info(f"Process {process_pid} tree terminated successfully via taskkill.")
+            else: logger.warning(f"Taskkill may have failed for PID {process_pid}. ExitCode: {result.returncode}, Stderr: {result.stderr.decode(errors='ignore')}")
+        else: # Linux/macOS
+            pgid_to_kill = -1
+            try:
+                pgid_to_kill = os.getpgid(process_pid)
+                logger.debug(f"Attempting Linux/macOS termination: Sending SIGKILL to process group {pgid_to_kill}.")
+                os.killpg(pgid_to_kill, signal.SIGKILL)
+                logger.info(f"Sent SIGKILL to process group {pgid_to_kill}.")
+            except ProcessLookupError:
+                logger.warning(f"Process {process_pid} not found for getpgid/killpg, likely finished or already killed.")
+            except Exception as kill_err:
+                logger.error(f"Error during killpg for PGID {pgid_to_kill} (PID {process_pid}). Falling back to kill PID.", exc_info=True)
+                try:
+                    logger.debug(f"Fallback: Sending SIGKILL to process PID {process_pid}.")
+                    os.kill(process_pid, signal.SIGKILL)
+                    logger.info(f"Sent SIGKILL to process PID {process_pid}.")
+                except ProcessLookupError: logger.warning(f"Fallback kill failed: Process {process_pid} not found.")
+                except Exception as final_kill_err: logger.error(f"Fallback kill for PID {process_pid} also failed.", exc_info=True)
+    except ProcessLookupError: logger.warning(f"Process {process_pid} not found during termination attempt.")
+    except Exception as e: logger.error(f"Error during process termination logic for PID {process_pid}.", exc_info=True)
+
+def _stop_process(process: subprocess.Popen, process_pid: int, job_handle: int | None):
+    """Kills the process tree on a user stop and waits briefly for the process to exit, so cleanup finds it gone."""
+    _kill_process_tree(process_pid, job_handle)
+    try: process.wait(timeout=_STOP_WAIT_TIMEOUT)
+    except subprocess.TimeoutExpired: logger.warning(f"Process PID {process_pid} still running {_STOP_WAIT_TIMEOUT}s after stop kill.")
+
+def _reap_process(process: subprocess.Popen, process_pid: int) -> int | None:
+    """
+    Single cleanup path for a finished or abandoned command: kills the process if it is still
+    running, closes its pipes and reaps it. Returns the exit code, or None if it could not be collected.
+    Unlike Popen.__exit__, the final wait is bounded so a process that survives the kill cannot hang the worker.
+    """
+    if process.poll() is None:
+        logger.warning(f"Process PID {process_pid} still running during cleanup. Attempting final kill.")
+        try: process.kill()
+        except Exception: logger.error(f"Error during final process kill for PID {process_pid}.", exc_info=True)
+    for stream in (process.stdout, process.stderr):
+        if stream is None: continue
+        try: stream.close()
+        except Exception as e: logger.debug(f"Error closing pipe for PID {process_pid}: {e}")
+    try:
+        final_exit_code = process.wait(timeout=1)
+        logger.debug(f"Final process wait completed for PID {process_pid}. Exit code: {final_exit_code}.")
+        return final_exit_code
+    except subprocess.TimeoutExpired: logger.warning(f"Process PID {process_pid} did not exit cleanly after final wait timeout.")
+    except Exception: logger.error(f"Error during final process wait for PID {process_pid}.", exc_info=True)
+    return None
+
+def _returncode_note(returncode: int, stderr: bytes) -> bytes | None:
+    """
+    Returns the error message (bytes, ready to emit) reporting a non-zero exit code, or None when the emitted
+    stderr already mentions the code (e.g., "exited with code 1") and the message would be a duplicate.
+    ASCII digits are never part of a multi-byte sequence in the supported encodings, so the raw bytes are searched without decoding.
+    """
+    if stderr and b"%d" % returncode in stderr: return None
+    return _EXIT_CODE_ERROR % returncode
+
+# Bare commands that only print the working directory. PowerShell names are case-insensitive and include aliases;
+# POSIX command names are case-sensitive, and 'gl' / 'Get-Location' may be real programs there.
+_PWD_COMMANDS = frozenset(('pwd', 'get-location', 'gl')) if IS_WINDOWS else frozenset(('pwd',))
+_PWD_MAX_LEN = max(map(len, _PWD_COMMANDS)) # Longer commands are rejected without lower-casing them
+
+def _is_cd_command(command: str) -> bool:
+    """True for 'cd <path>' in any case. Checks three characters instead of lower-casing the whole command."""
+    return len(command) >= 3 and command[0] in 'cC' and command[1] in 'dD' and command[2].isspace()
+
+_PATH_ROOT_CHARS = '/\\' if IS_WINDOWS else '/' # Leading characters of a rooted path ('C:' drives are checked separately)
+
+def wake_running_commands():
+    """Makes running commands check their stop flags now. Called by worker stop() after clearing the running flag."""
+    if ProcessStreamPump is not None and not IS_WINDOWS: ProcessStreamPump.wake_all()
+
+def _resolve_cd(cwd: str, path_part: str) -> str:
+    """Resolves the argument of 'cd' (quotes stripped, '~' expanded) against cwd. Returns the normalized target path."""
+    if len(path_part) >= 2 and path_part[0] == path_part[-1] and path_part[0] in '"\'': path_part = path_part[1:-1]
+    if not path_part or path_part == '~': return _HOME
+    if path_part[0] == '~': path_part = os.path.expanduser(path_part)
+    # Rooted paths skip the join; checking the first characters is cheaper than os.path.isabs()
+    if path_part[0] in _PATH_ROOT_CHARS or (IS_WINDOWS and path_part[1:2] == ':'): return os.path.normpath(path_part)
+    return os.path.normpath(os.path.join(cwd, path_part))
+
 def execute_command_streamed( # Function name kept for compatibility
     command: str,
     cwd: str,
@@ -37,7 +221,7 @@ def execute_command_streamed( # Function name kept for compatibility
     is_manual_command: bool
 ) -> tuple[str, int | None]:
     """
-    Executes a shell command, handling 'cd' directly. Reads output after completion. Logs the process.
+    Executes a shell command, handling 'cd' directly. Streams output while it runs. Logs the process.
 
     Args:
         command: The command string to execute.
@@ -58,11 +242,12 @@ def execute_command_streamed( # Function name kept for compatibility
     exit_code = None
     process: subprocess.Popen | None = None
     process_pid = -1
+    job_handle: int | None = None
 
     # --- Signal Emission Helpers with Logging ---
     def _emit_error(message: str):
         logger.debug(f"Emitting error signal: {message}")
-        try: error_signal.emit(f"Error: {message}".encode('utf-8'))
+        try: error_signal.emit(_ERROR_PREFIX + message.encode('utf-8'))
         except RuntimeError: logger.warning("Cannot emit error signal, target likely deleted.")
         except Exception as e: logger.error("Unexpected error emitting error signal.", exc_info=True)
 
@@ -84,31 +269,13 @@ def execute_command_streamed( # Function name kept for compatibility
 
     # --- Handle 'cd' command directly ---
     command = command.strip()
-    if command.lower().startswith('cd '):
+    if _is_cd_command(command):
         logger.info("Handling 'cd' command directly.")
         original_dir = current_cwd
         try:
             path_part = command[3:].strip()
-            # Handle quotes
-            if len(path_part) >= 2 and ((path_part.startswith('"') and path_part.endswith('"')) or \
-                                       (path_part.startswith("'") and path_part.endswith("'"))):
-                path_part = path_part[1:-1]
-                logger.debug(f"'cd': Path part after removing quotes: '{path_part}'")
-
-            if not path_part or path_part == '~':
-                target_dir = os.path.expanduser("~")
-                logger.debug(f"'cd': Targeting home directory: {target_dir}")
-            else:
-                target_dir_expanded = os.path.expanduser(path_part)
-                if not os.path.isabs(target_dir_expanded):
-                    target_dir = os.path.abspath(os.path.join(current_cwd, target_dir_expanded))
-                    logger.debug(f"'cd': Relative path '{target_dir_expanded}' resolved to absolute: {target_dir}")
-                else:
-                    target_dir = target_dir_expanded
-                    logger.debug(f"'cd': Path part '{path_part}' resolved to absolute: {target_dir}")
-
-            target_dir = os.path.normpath(target_dir)
-            logger.debug(f"'cd': Final normalized target directory: {target_dir}")
+            target_dir = _resolve_cd(current_cwd, path_part)
+            logger.debug(f"'cd': '{path_part}' resolved to: {target_dir}")
 
             if os.path.isdir(target_dir):
                 current_cwd = target_dir
@@ -126,6 +293,12 @@ def execute_command_streamed( # Function name kept for compatibility
         return current_cwd, None # Exit code is None for 'cd'
     # --- End 'cd' handling ---
 
+    # --- Handle bare 'pwd' directly (no shell needed to print the CWD we already track) ---
+    if len(command) <= _PWD_MAX_LEN and (command.lower() if IS_WINDOWS else command) in _PWD_COMMANDS:
+        logger.info("Handling 'pwd' command directly.")
+        if not stop_flag_func(): _emit_output_bytes(current_cwd.encode('utf-8') + b"\n", is_stderr=False)
+        return current_cwd, 0
+
     # --- Pre-Execution Checks ---
     if stop_flag_func():
         logger.warning("Execution skipped: Stop flag was set before start.")
@@ -138,85 +311,62 @@ def execute_command_streamed( # Function name kept for compatibility
     stdout_data = b""
     stderr_data = b""
     try:
-        run_args = None; use_shell = False; creationflags = 0; preexec_fn = None
-        os_name = platform.system()
-        logger.debug(f"Preparing command for OS: {os_name}")
+        try:
+            run_args, creationflags, preexec_fn = _build_run_args(command)
+        except Exception as build_err:
+            logger.error(f"Error preparing command arguments: {build_err}", exc_info=True)
+            _emit_error(f"Error preparing command arguments: {build_err}"); return current_cwd, None
+        logger.debug(f"Launcher for {'Windows (PowerShell -EncodedCommand)' if IS_WINDOWS else f'POSIX ({_SHELL_PATH})'}; command (first 200 chars): {command[:200]}")
 
-        # --- Prepare command arguments ---
-        if os_name == "Windows":
-            try:
-                logger.debug("Using PowerShell with EncodedCommand.")
-                # Construct the PowerShell command to handle errors and suppress progress
-                ps_command_safe_no_progress = f"$ProgressPreference = 'SilentlyContinue'; try {{ {command} }} catch {{ Write-Error $_; exit 1 }}"
-                logger.debug(f"PowerShell Script (Original): {ps_command_safe_no_progress[:200]}...")
-                encoded_bytes = ps_command_safe_no_progress.encode('utf-16le')
-                encoded_ps_command = base64.b64encode(encoded_bytes).decode('ascii')
-                run_args = ["powershell.exe", "-NoProfile", "-ExecutionPolicy", "Bypass", "-EncodedCommand", encoded_ps_command]
-                creationflags = subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
-                logger.debug(f"PowerShell Encoded Command (first 100 chars): {encoded_ps_command[:100]}...")
-            except Exception as encode_err:
-                 logger.error(f"Error encoding command for PowerShell: {encode_err}", exc_info=True)
-                 _emit_error(f"Error encoding command for PowerShell: {encode_err}"); return current_cwd, None
-        else: # Linux / macOS
-            shell_path = os.environ.get("SHELL", "/bin/sh")
-            logger.debug(f"Using Shell: {shell_path}")
-            run_args = [shell_path, "-c", command]
-            try: preexec_fn = os.setsid # Try to start in new session to allow group kill
-            except AttributeError: logger.warning("os.setsid not available on this platform."); preexec_fn = None
-        # --- End argument preparation ---
-
-        if run_args is None: logger.error("Could not determine run arguments for subprocess."); return current_cwd, None
         if stop_flag_func(): logger.warning("Execution skipped: Stop flag set before Popen."); return current_cwd, exit_code
 
         logger.info(f"Executing Popen: {run_args}")
+        # bufsize=0: the pipes are read with os.read(fd, 64 KiB), so a BufferedReader would only add an unused buffer layer
         process = subprocess.Popen(
-            run_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=current_cwd, shell=use_shell,
-            creationflags=creationflags, preexec_fn=preexec_fn
+            run_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=current_cwd,
+            creationflags=creationflags, preexec_fn=preexec_fn, bufsize=0
         )
         process_pid = process.pid
         logger.info(f"Process started with PID: {process_pid}")
+        if IS_WINDOWS: job_handle = _assign_job_object(process)
+
+        # --- Stream output live while the process runs ---
+        streamed_output = False
+        stderr_tail = bytearray() # Last _STDERR_TAIL_BYTES of streamed stderr, kept for the exit code check below
+        pipe_readers = []
+        def _on_stdout(chunk: bytes): _emit_output_bytes(chunk, is_stderr=False)
+        def _on_stderr(chunk: bytes):
+            stderr_tail.extend(chunk)
+            if len(stderr_tail) > _STDERR_TAIL_BYTES: del stderr_tail[:-_STDERR_TAIL_BYTES]
+            _emit_output_bytes(chunk, is_stderr=True)
+        if not IS_WINDOWS and ProcessStreamPump is not None: # Linux/macOS
+            streamed_output = True
+            pump = ProcessStreamPump(process, stop_flag_func, on_stdout=_on_stdout, on_stderr=_on_stderr)
+            logger.debug(f"Streaming stdout/stderr for PID {process_pid} via selector pump.")
+            if not pump.run():
+                logger.warning(f"Stop signal received for PID {process_pid} while streaming. Terminating process...")
+                _stop_process(process, process_pid, job_handle)
+                exit_code = -999 # Use a specific code for manual stop
+        elif IS_WINDOWS and PipeReader is not None:
+            streamed_output = True
+            pipe_readers = [PipeReader.start_reading(process.stdout, _on_stdout), PipeReader.start_reading(process.stderr, _on_stderr, filter_clixml=True)]
+            logger.debug(f"Streaming stdout/stderr for PID {process_pid} via pooled pipe readers.")
 
         # --- Wait for process completion OR stop signal ---
-        termination_initiated = False
-        while process.poll() is None:
+        # Popen.wait returns as soon as the child exits; the timeout only bounds how long a stop request can go unnoticed.
+        # With pooled readers the loop also wakes often enough to release their coalesced output.
+        wait_timeout = PipeReader.RELEASE_INTERVAL if pipe_readers else _WAIT_POLL_TIMEOUT
+        while exit_code is None:
             if stop_flag_func():
                 logger.warning(f"Stop signal received for PID {process_pid}. Terminating process...")
-                termination_initiated = True
-                # --- Termination Logic ---
-                try:
-                    if platform.system() == "Windows":
-                        kill_cmd = ['taskkill', '/PID', str(process_pid), '/T', '/F']; kill_flags = subprocess.CREATE_NO_WINDOW
-                        logger.debug(f"Attempting Windows termination: {kill_cmd}")
-                        result = subprocess.run(kill_cmd, check=False, capture_output=True, creationflags=kill_flags, timeout=5)
-                        if result.returncode == 0: logger.info(f"Process {process_pid} tree terminated successfully via taskkill.")
-                        else: logger.warning(f"Taskkill may have failed for PID {process_pid}. ExitCode: {result.returncode}, Stderr: {result.stderr.decode(errors='ignore')}")
-                    else: # Linux/macOS
-                        import signal
-                        pgid_to_kill = -1
-                        try:
-                            pgid_to_kill = os.getpgid(process_pid)
-                            logger.debug(f"Attempting Linux/macOS termination: Sending SIGKILL to process group {pgid_to_kill}.")
-                            os.killpg(pgid_to_kill, signal.SIGKILL)
-                            logger.info(f"Sent SIGKILL to process group {pgid_to_kill}.")
-                        except ProcessLookupError:
-                            logger.warning(f"Process {process_pid} not found for getpgid/killpg, likely finished or already killed.")
-                        except Exception as kill_err:
-                            logger.error(f"Error during killpg for PGID {pgid_to_kill} (PID {process_pid}). Falling back to kill PID.", exc_info=True)
-                            try:
-                                logger.debug(f"Fallback: Sending SIGKILL to process PID {process_pid}.")
-                                os.kill(process_pid, signal.SIGKILL)
-                                logger.info(f"Sent SIGKILL to process PID {process_pid}.")
-                            except ProcessLookupError: logger.warning(f"Fallback kill failed: Process {process_pid} not found.")
-                            except Exception as final_kill_err: logger.error(f"Fallback kill for PID {process_pid} also failed.", exc_info=True)
-                except ProcessLookupError: logger.warning(f"Process {process_pid} not found during termination attempt.")
-                except Exception as e: logger.error(f"Error during process termination logic for PID {process_pid}.", exc_info=True)
-                # --- End Termination Logic ---
+                _stop_process(process, process_pid, job_handle)
                 exit_code = -999 # Use a specific code for manual stop
                 break # Exit the waiting loop
-
-            # Use QThread.msleep for better Qt integration if available, else time.sleep
-            try: QThread.msleep(100)
-            except: time.sleep(0.1)
+            try:
+                process.wait(timeout=wait_timeout)
+                break # Process exited
+            except subprocess.TimeoutExpired:
+                for reader in pipe_readers: reader.release_due()
 
         # --- Process Finished or Terminated ---
         if exit_code is None: # If not stopped manually, get the final exit code
@@ -225,50 +375,48 @@ def execute_command_streamed( # Function name kept for compatibility
         else:
              logger.info(f"Process PID {process_pid} was terminated manually. Exit code set to: {exit_code}")
 
-
-        # --- Read Remaining Output AFTER process exit ---
-        logger.debug(f"Reading final stdout/stderr for PID {process_pid}...")
-        try:
-            # Use communicate() for safety and to avoid potential deadlocks
-            stdout_data, stderr_data = process.communicate(timeout=10) # Increased timeout slightly
-            logger.debug(f"Communicate successful. Stdout bytes: {len(stdout_data)}, Stderr bytes: {len(stderr_data)}")
-        except subprocess.TimeoutExpired:
-             logger.warning(f"Timeout expired during communicate() for PID {process_pid}. Killing process.")
-             process.kill()
-             stdout_data, stderr_data = process.communicate() # Try again after kill
-             logger.debug(f"Communicate after kill. Stdout bytes: {len(stdout_data)}, Stderr bytes: {len(stderr_data)}")
-        except Exception as comm_err:
-             logger.error(f"Error during process.communicate() for PID {process_pid}.", exc_info=True)
-             # Attempt manual reads as fallback
-             try:
-                 logger.debug(f"Attempting fallback read() for PID {process_pid}...")
-                 if process.stdout: stdout_data = process.stdout.read()
-                 if process.stderr: stderr_data = process.stderr.read()
-                 logger.debug(f"Fallback read. Stdout bytes: {len(stdout_data)}, Stderr bytes: {len(stderr_data)}")
-             except Exception as read_err:
-                 logger.error(f"Error during fallback read() for PID {process_pid}.", exc_info=True)
-
-        # --- Emit Final Output ---
-        if stdout_data:
-            logger.info(f"Emitting final stdout ({len(stdout_data)} bytes) for PID {process_pid}.")
-            _emit_output_bytes(stdout_data, is_stderr=False)
-        if stderr_data:
-            logger.info(f"Emitting final stderr ({len(stderr_data)} bytes) for PID {process_pid}.")
-            _emit_output_bytes(stderr_data, is_stderr=True)
+        if streamed_output:
+            for reader in pipe_readers: # The pipes close once the process (tree) is gone
+                if not reader.wait(_READER_DRAIN_TIMEOUT): logger.warning(f"Pipe reader for PID {process_pid} did not reach EOF within {_READER_DRAIN_TIMEOUT}s.")
+            stderr_data = stderr_tail # Only searched below; no need to copy into bytes
+        else:
+            # --- Read Remaining Output AFTER process exit ---
+            logger.debug(f"Reading final stdout/stderr for PID {process_pid}...")
+            try:
+                # Use communicate() for safety and to avoid potential deadlocks
+                stdout_data, stderr_data = process.communicate(timeout=10) # Increased timeout slightly
+                logger.debug(f"Communicate successful. Stdout bytes: {len(stdout_data)}, Stderr bytes: {len(stderr_data)}")
+            except subprocess.TimeoutExpired:
+                 logger.warning(f"Timeout expired during communicate() for PID {process_pid}. Killing process.")
+                 process.kill()
+                 stdout_data, stderr_data = process.communicate() # Try again after kill
+                 logger.debug(f"Communicate after kill. Stdout bytes: {len(stdout_data)}, Stderr bytes: {len(stderr_data)}")
+            except Exception as comm_err:
+                 logger.error(f"Error during process.communicate() for PID {process_pid}.", exc_info=True)
+                 # Attempt manual reads as fallback
+                 try:
+                     logger.debug(f"Attempting fallback read() for PID {process_pid}...")
+                     if process.stdout: stdout_data = process.stdout.read()
+                     if process.stderr: stderr_data = process.stderr.read()
+                     logger.debug(f"Fallback read. Stdout bytes: {len(stdout_data)}, Stderr bytes: {len(stderr_data)}")
+                 except Exception as read_err:
+                     logger.error(f"Error during fallback read() for PID {process_pid}.", exc_info=True)
+
+            # --- Emit Final Output ---
+            if stdout_data:
+                logger.info(f"Emitting final stdout ({len(stdout_data)} bytes) for PID {process_pid}.")
+                _emit_output_bytes(stdout_data, is_stderr=False)
+            if stderr_data:
+                logger.info(f"Emitting final stderr ({len(stderr_data)} bytes) for PID {process_pid}.")
+                _emit_output_bytes(stderr_data, is_stderr=True)
 
         # --- Check Final Return Code and Emit Error if Needed ---
         if exit_code is not None and exit_code != 0 and exit_code != -999:
              logger.warning(f"Command PID {process_pid} exited with non-zero code: {exit_code}.")
-             emitted_any_stderr = bool(stderr_data)
-             # Decode stderr for checking if exit code message is already present
-             stderr_str_for_check = decode_output(stderr_data) if emitted_any_stderr else ""
-             # Avoid duplicate error messages
-             exit_code_str = str(exit_code)
-             # Check more robustly if the exit code is part of the error message (e.g., "exited with code 1")
-             if not emitted_any_stderr or (exit_code_str not in stderr_str_for_check and f"code {exit_code_str}" not in stderr_str_for_check.lower()):
-                  exit_msg = f"Command exited with code: {exit_code}"
-                  logger.info(f"Emitting explicit exit code error message for PID {process_pid}: {exit_msg}")
-                  _emit_error(exit_msg)
+             exit_msg = _returncode_note(exit_code, stderr_data[-_STDERR_TAIL_BYTES:])
+             if exit_msg is not None:
+                  logger.info(f"Emitting explicit exit code error message for PID {process_pid} (code {exit_code}).")
+                  _emit_output_bytes(exit_msg, is_stderr=True)
              else:
                   logger.info(f"Non-zero exit code message for PID {process_pid} suppressed as stderr likely contained relevant info.")
 
@@ -282,27 +430,10 @@ def execute_command_streamed( # Function name kept for compatibility
         _emit_error(f"Unexpected execution error: {exec_err}"); exit_code = -1 # Indicate error
     finally:
         # --- Final Process Cleanup ---
-        if process and process.poll() is None:
-            logger.warning(f"Process PID {process_pid} still running in finally block. Attempting final kill.")
-            try: process.kill(); process.wait(timeout=1)
-            except Exception as final_kill_err: logger.error(f"Error during final process kill/wait for PID {process_pid}.", exc_info=True)
-
-        # Close pipes explicitly (less critical now with communicate, but can be good practice)
         if process:
-             if process.stdout:
-                 try: process.stdout.close()
-                 except Exception as e: logger.debug(f"Error closing stdout for PID {process_pid}: {e}")
-             if process.stderr:
-                 try: process.stderr.close()
-                 except Exception as e: logger.debug(f"Error closing stderr for PID {process_pid}: {e}")
-        # Final wait attempt
-        if process:
-            try:
-                final_exit_code = process.wait(timeout=0.5)
-                if exit_code is None: exit_code = final_exit_code # Update exit code if not set yet
-                logger.debug(f"Final process wait completed for PID {process_pid}. Exit code: {final_exit_code}.")
-            except subprocess.TimeoutExpired: logger.warning(f"Process PID {process_pid} did not exit cleanly after final wait timeout.")
-            except Exception as wait_err: logger.error(f"Error during final process wait for PID {process_pid}.", exc_info=True)
+            final_exit_code = _reap_process(process, process_pid)
+            if exit_code is None: exit_code = final_exit_code # Update exit code if not set yet
+        _close_job_object(job_handle)
 
         logger.info(f"Finished executing command logic for PID {process_pid} ('{command[:50]}{'...' if len(command)>50 else ''}'). Final exit code: {exit_code}")
 
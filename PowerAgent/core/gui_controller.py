@@ -13,11 +13,14 @@ This module should only be imported and used on Windows platforms.
 
 import platform
 import time
-import traceback
 import json # For JSON formatting of UI tree
+import logging
 from typing import Dict, Any, Optional, Union, List # Added List
 
-from PySide6.QtCore import QObject, Signal
+from PySide6.QtCore import QObject, Signal, QThread
+
+# --- Get Logger ---
+logger = logging.getLogger(__name__)
 
 # --- uiautomation Import ---
 UIAUTOMATION_AVAILABLE = False
@@ -29,19 +32,17 @@ if platform.system() == "Windows":
             # Verify basic functionality without excessive waiting
             auto.GetRootControl(wait_time=0.1)
             UIAUTOMATION_AVAILABLE = True
-            print("[GuiController] 'uiautomation' library imported and verified successfully.")
+            logger.info("'uiautomation' library imported and verified successfully.")
         except Exception as verify_err:
             UIAUTOMATION_AVAILABLE = False
             UIAUTOMATION_IMPORT_ERROR = f"Failed to verify 'uiautomation' functionality: {verify_err}"
-            print(f"ERROR: {UIAUTOMATION_IMPORT_ERROR}")
-            traceback.print_exc()
+            logger.error(UIAUTOMATION_IMPORT_ERROR, exc_info=True)
     except ImportError:
         UIAUTOMATION_IMPORT_ERROR = "Failed to import 'uiautomation'. Please install it (`pip install uiautomation`). GUI control disabled."
-        print(f"WARNING: {UIAUTOMATION_IMPORT_ERROR}")
+        logger.warning(UIAUTOMATION_IMPORT_ERROR)
     except Exception as import_err:
         UIAUTOMATION_IMPORT_ERROR = f"An unexpected error occurred importing 'uiautomation': {import_err}. GUI control disabled."
-        print(f"ERROR: {UIAUTOMATION_IMPORT_ERROR}")
-        traceback.print_exc()
+        logger.error(UIAUTOMATION_IMPORT_ERROR, exc_info=True)
 else:
     UIAUTOMATION_IMPORT_ERROR = "GUI Automation is only supported on Windows."
     auto = None # Define auto as None for type hinting consistency outside Windows
@@ -98,7 +99,7 @@ def get_simplified_ui_tree(control: auto.Control, max_depth: int = 3, current_de
                 # GetChildren can also fail if the parent disappears
                 children = control.GetChildren()
             except Exception as get_child_err:
-                 print(f"Warning: Failed to get children for control {info.get('name', 'N/A')}: {get_child_err}")
+                 logger.warning(f"Failed to get children for control {info.get('name', 'N/A')}: {get_child_err}")
 
             if children:
                 for child in children:
@@ -116,7 +117,7 @@ def get_simplified_ui_tree(control: auto.Control, max_depth: int = 3, current_de
         control_name = "[Error getting name]"
         try: control_name = control.Name
         except Exception: pass
-        print(f"Warning: Error processing control '{control_name}': {type(e).__name__} - {e}")
+        logger.warning(f"Error processing control '{control_name}': {type(e).__name__} - {e}")
         return None
 
 def format_tree_as_text(node: Optional[Dict[str, Any]], indent: str = "") -> str:
@@ -159,7 +160,7 @@ def get_active_window_ui_text(format_type: str = "text", max_depth: int = 3) ->
         A string containing the formatted UI information, or an error message string, or None if uiautomation unavailable.
     """
     if not UIAUTOMATION_AVAILABLE:
-        print("[get_active_window_ui_text] Error: uiautomation is not available.")
+        logger.error("Cannot read the active window UI: uiautomation is not available.")
         return "错误: GUI 分析功能不可用 (uiautomation 未加载)。" # Return error message
 
     active_window: Optional[auto.Control] = None
@@ -181,7 +182,7 @@ def get_active_window_ui_text(format_type: str = "text", max_depth: int = 3) ->
                     except Exception: break # Stop if GetParentControl fails
 
         if not active_window:
-            print("[get_active_window_ui_text] Error: Could not get the active window.")
+            logger.error("Could not get the active window.")
             return "错误: 无法确定当前活动窗口。" # Return error message
 
         window_name = "[Error getting name]"
@@ -191,16 +192,16 @@ def get_active_window_ui_text(format_type: str = "text", max_depth: int = 3) ->
         try: window_class = active_window.ClassName
         except Exception: pass
 
-        print(f"[get_active_window_ui_text] Analyzing active window: '{window_name}' ({window_class})")
+        logger.debug(f"Analyzing active window: '{window_name}' ({window_class})")
 
         # 2. 获取简化的 UI 树信息
         start_time = time.time()
         simplified_tree = get_simplified_ui_tree(active_window, max_depth)
         analysis_time = time.time() - start_time
-        print(f"[get_active_window_ui_text] UI tree analysis took: {analysis_time:.3f}s")
+        logger.debug(f"UI tree analysis took: {analysis_time:.3f}s")
 
         if not simplified_tree:
-            print("[get_active_window_ui_text] No analyzable UI elements found in the active window.")
+            logger.debug("No analyzable UI elements found in the active window.")
             return f"信息: 活动窗口 '{window_name}' 中未找到可分析的 UI 元素 (或分析出错)。" # Return info message
 
         # 3. 格式化为文本 (限制元素数量可以在这里实现，或在递归函数中)
@@ -210,7 +211,7 @@ def get_active_window_ui_text(format_type: str = "text", max_depth: int = 3) ->
                 # 使用 indent=None 生成更紧凑的 JSON，节省 token
                 output_str = json.dumps(simplified_tree, ensure_ascii=False, indent=None, separators=(',', ':'))
             except Exception as json_err:
-                print(f"[get_active_window_ui_text] Error serializing UI tree to JSON: {json_err}")
+                logger.error(f"Error serializing UI tree to JSON: {json_err}")
                 return f"错误: 无法将 UI 树序列化为 JSON: {json_err}" # Return error message
         elif format_type.lower() == "text":
             try:
@@ -218,17 +219,16 @@ def get_active_window_ui_text(format_type: str = "text", max_depth: int = 3) ->
                 tree_text = format_tree_as_text(simplified_tree, indent="  ")
                 output_str = header + tree_text if tree_text else header + "  (无子元素或分析错误)"
             except Exception as text_format_err:
-                 print(f"[get_active_window_ui_text] Error formatting UI tree as text: {text_format_err}")
+                 logger.error(f"Error formatting UI tree as text: {text_format_err}")
                  return f"错误: 格式化 UI 树为文本时出错: {text_format_err}" # Return error message
         else:
-            print(f"[get_active_window_ui_text] Error: Unsupported format type '{format_type}'.")
+            logger.error(f"Unsupported format type '{format_type}'.")
             return f"错误: 不支持的格式类型 '{format_type}'。" # Return error message
 
         return output_str
 
     except Exception as e:
-        print(f"[get_active_window_ui_text] Unexpected error: {type(e).__name__} - {e}")
-        traceback.print_exc()
+        logger.error(f"Unexpected error reading the active window UI: {type(e).__name__} - {e}", exc_info=True)
         return f"错误: 获取 UI 信息时发生意外错误: {e}" # Return error message
 
 # ============================================================= #
@@ -264,20 +264,20 @@ class GuiController(QObject):
             return False
         return True # If initialized_ok is true
 
-    def _emit_error(self, message: str):
-        """Safely emit an error message."""
-        print(f"[GuiController] Error: {message}")
+    def _emit_error(self, message: str, exc_info: bool = False):
+        """Safely emit an error message. exc_info: also log the traceback of the exception being handled."""
+        logger.error(message, exc_info=exc_info)
         try:
             # Check if there are any connected receivers before emitting
             if self.receivers(self.error_signal) > 0:
                 self.error_signal.emit(message)
             else:
-                print("[GuiController] Warning: No receivers connected to error_signal.")
+                logger.warning("No receivers connected to error_signal.")
         except RuntimeError as e:
             # This can happen if the receiver (e.g., MainWindow) is being deleted
-            print(f"[GuiController] Warning: Could not emit error signal (RuntimeError): {e}")
+            logger.warning(f"Could not emit error signal (RuntimeError): {e}")
         except Exception as e:
-             print(f"[GuiController] Unexpected error emitting signal: {e}")
+             logger.error(f"Unexpected error emitting signal: {e}")
 
     # --- ERROR LOCATION 2: Line 163 ---
     # Pylance Error: 类型表达式中不允许使用变量 (Variable is not allowed in type expression) - likely referring to 'Any'
@@ -307,7 +307,7 @@ class GuiController(QObject):
         try: context_name = parent_control.Name if parent_control else "Desktop Root"
         except Exception: pass
 
-        print(f"[GuiController] Searching within '{context_name}' for control with locators: {search_args}, Timeout: {timeout_seconds}s")
+        logger.debug(f"Searching within '{context_name}' for control with locators: {search_args}, Timeout: {timeout_seconds}s")
         try:
             start_time = time.time()
             control = None
@@ -341,31 +341,26 @@ class GuiController(QObject):
                             except Exception: pass
                             try: control_type_found = control.ControlTypeName
                             except Exception: pass
-                            print(f"[GuiController] Control found and verified stable: '{control_name_found}' ({control_type_found}) within '{context_name}'")
+                            logger.debug(f"Control found and verified stable: '{control_name_found}' ({control_type_found}) within '{context_name}'")
                             return control
                         else:
                              # Found but not stable yet, log and continue loop
-                             print(f"[GuiController] Control found but failed stability check. Continuing search...")
+                             logger.debug(f"Control found but failed stability check. Continuing search...")
                              control = None # Reset control so loop continues correctly
 
                 except LookupError:
                     pass # Control not found yet, continue loop
                 except AttributeError as ae:
                      # This might happen if a specific control type method (e.g., EditControl) isn't found on the context
-                     print(f"[GuiController] Attribute error during search (check ControlType?): {ae}")
+                     logger.debug(f"Attribute error during search (check ControlType?): {ae}")
                      pass # Continue loop, maybe the generic Control() will work
                 except Exception as find_err:
                     # Catch other potential errors during find, log them, but keep trying
-                    print(f"[GuiController] Error during specific find attempt: {type(find_err).__name__} - {find_err}. Continuing search...")
+                    logger.debug(f"Error during specific find attempt: {type(find_err).__name__} - {find_err}. Continuing search...")
                     pass # Continue loop
 
                 # If control wasn't found or wasn't stable, wait before next check
-                # Use QThread.msleep if running in a QThread context, otherwise time.sleep
-                try:
-                    from PySide6.QtCore import QThread
-                    QThread.msleep(200) # 200ms
-                except ImportError:
-                    time.sleep(0.2)
+                QThread.msleep(200) # 200ms
 
             # Loop finished without finding a stable control
             self._emit_error(f"Control not found or not stable within {timeout_seconds}s in '{context_name}' using locators: {search_args}")
@@ -374,8 +369,7 @@ class GuiController(QObject):
         except Exception as e:
             # Catch unexpected errors in the overall search logic
             err_msg = f"Unexpected error finding control {search_args} in '{context_name}': {type(e).__name__} - {e}"
-            self._emit_error(err_msg)
-            traceback.print_exc()
+            self._emit_error(err_msg, exc_info=True)
             return None
 
     # --- _resolve_parent, click_control, set_text, get_text, select_item, toggle_checkbox, get_control_state ---
@@ -395,7 +389,7 @@ class GuiController(QObject):
         direct_parent = args.get('parent_control')
 
         if direct_parent:
-             print("[GuiController] Using directly provided parent control.")
+             logger.debug("Using directly provided parent control.")
              # Basic check if it's a uiautomation control type
              if hasattr(direct_parent, 'Exists'):
                  parent_control = direct_parent
@@ -403,7 +397,7 @@ class GuiController(QObject):
                  self._emit_error("Provided 'parent_control' is not a valid uiautomation control.")
                  return None
         elif parent_locators:
-            print(f"[GuiController] Resolving parent control using locators: {parent_locators}")
+            logger.debug(f"Resolving parent control using locators: {parent_locators}")
             parent_control = self._find_control_internal(parent_locators, timeout_seconds=timeout) # Search from root for parent
             if not parent_control:
                 # Emit error only if parent was specified via locators but not found.
@@ -431,18 +425,18 @@ class GuiController(QObject):
                 control_name = "[Error getting name]"
                 try: control_name = control.Name
                 except Exception: pass
-                print(f"[GuiController] Clicking control: '{control_name}'")
+                logger.debug(f"Clicking control: '{control_name}'")
                 # Check IsEnabled state before clicking
                 is_enabled = False
                 try: is_enabled = control.IsEnabled
-                except Exception: print(f"Warning: Could not get IsEnabled state for control '{control_name}'")
+                except Exception: logger.warning(f"Could not get IsEnabled state for control '{control_name}'")
                 if not is_enabled:
                      self._emit_error(f"Cannot click control '{control_name}': Control is disabled.")
                      return False
 
                 # Perform the click
                 control.Click(waitTime=0.1) # waitTime adds a small delay *after* the action
-                print(f"[GuiController] Click successful.")
+                logger.debug(f"Click successful.")
                 # time.sleep(0.1) # Optional additional pause
                 return True
             except Exception as e:
@@ -450,8 +444,7 @@ class GuiController(QObject):
                 try: control_name_err = control.Name
                 except Exception: pass
                 err_msg = f"Failed to click control '{control_name_err}': {type(e).__name__} - {e}"
-                self._emit_error(err_msg)
-                traceback.print_exc()
+                self._emit_error(err_msg, exc_info=True)
                 return False
         # Error for not finding control already emitted by _find_control_internal
         return False
@@ -480,12 +473,12 @@ class GuiController(QObject):
                 control_name = "[Error getting name]"
                 try: control_name = control.Name
                 except Exception: pass
-                print(f"[GuiController] Setting text for control: '{control_name}' to '{value[:50]}{'...' if len(value)>50 else ''}'")
+                logger.debug(f"Setting text for control: '{control_name}' to '{value[:50]}{'...' if len(value)>50 else ''}'")
 
                 # Check IsEnabled state before setting text
                 is_enabled = False
                 try: is_enabled = control.IsEnabled
-                except Exception: print(f"Warning: Could not get IsEnabled state for control '{control_name}'")
+                except Exception: logger.warning(f"Could not get IsEnabled state for control '{control_name}'")
                 if not is_enabled:
                      self._emit_error(f"Cannot set text for control '{control_name}': Control is disabled.")
                      return False
@@ -493,13 +486,13 @@ class GuiController(QObject):
                 # Check if ValuePattern is available
                 has_value_pattern = False
                 try: has_value_pattern = control.IsValuePatternAvailable()
-                except Exception: print(f"Warning: Could not check ValuePattern for control '{control_name}'")
+                except Exception: logger.warning(f"Could not check ValuePattern for control '{control_name}'")
 
                 if has_value_pattern:
                     control.SetValue(value, waitTime=0.1)
                 else:
                      # Fallback: Try SendKeys if ValuePattern is not supported (less reliable)
-                     print(f"[GuiController] Warning: Control '{control_name}' does not support ValuePattern. Attempting SendKeys fallback.")
+                     logger.warning(f"Control '{control_name}' does not support ValuePattern. Attempting SendKeys fallback.")
                      # Need to focus the control first for SendKeys
                      try:
                          control.SetFocus()
@@ -514,7 +507,7 @@ class GuiController(QObject):
                          self._emit_error(f"Control '{control_name}' does not support ValuePattern and SendKeys fallback failed: {sk_err}")
                          return False
 
-                print(f"[GuiController] Set text successful (or SendKeys attempted).")
+                logger.debug(f"Set text successful (or SendKeys attempted).")
                 # time.sleep(0.1) # Optional pause
                 return True
             except Exception as e:
@@ -522,8 +515,7 @@ class GuiController(QObject):
                 try: control_name_err = control.Name
                 except Exception: pass
                 err_msg = f"Failed to set text for control '{control_name_err}': {type(e).__name__} - {e}"
-                self._emit_error(err_msg)
-                traceback.print_exc()
+                self._emit_error(err_msg, exc_info=True)
                 return False
         return False
 
@@ -550,24 +542,23 @@ class GuiController(QObject):
 
                 if has_value_pattern:
                     text_value = control.CurrentValue()
-                    print(f"[GuiController] Getting text via ValuePattern for control: '{control_name}'")
+                    logger.debug(f"Getting text via ValuePattern for control: '{control_name}'")
                 # TextPattern rarely provides full editable text, Name is often better fallback
                 # elif control.IsTextPatternAvailable():
                 #     print(f"[GuiController] Getting text via TextPattern (using Name fallback) for control: {control_name}")
                 #     text_value = control.Name # Fallback for TextPattern only controls
                 else:
                     # Default fallback to Name property
-                    print(f"[GuiController] Getting text via Name property for control: '{control_name}'")
+                    logger.debug(f"Getting text via Name property for control: '{control_name}'")
                     text_value = control.Name
 
                 # Ensure return value is a string
                 result = str(text_value) if text_value is not None else ""
-                print(f"[GuiController] Get text successful. Value: '{result[:100]}{'...' if len(result)>100 else ''}'")
+                logger.debug(f"Get text successful. Value: '{result[:100]}{'...' if len(result)>100 else ''}'")
                 return result
             except Exception as e:
                 err_msg = f"Failed to get text for control '{control_name}': {type(e).__name__} - {e}"
-                self._emit_error(err_msg)
-                traceback.print_exc()
+                self._emit_error(err_msg, exc_info=True)
                 return None # Return None on error
         return None # Return None if control not found
 
@@ -593,7 +584,7 @@ class GuiController(QObject):
             try: container_name = container_control.Name
             except Exception: pass
             try:
-                print(f"[GuiController] Attempting to select item '{value_to_select}' in container: '{container_name}'")
+                logger.debug(f"Attempting to select item '{value_to_select}' in container: '{container_name}'")
 
                 item_to_select: Optional[auto.Control] = None
 
@@ -604,16 +595,16 @@ class GuiController(QObject):
                         current_state = container_control.CurrentExpandCollapseState
                         is_expanded = (current_state == auto.ExpandCollapseState.Expanded)
                         if not is_expanded:
-                            print(f"[GuiController] Container '{container_name}' is collapsed, attempting to expand...")
+                            logger.debug(f"Container '{container_name}' is collapsed, attempting to expand...")
                             container_control.Expand(waitTime=0.5) # Expand and wait briefly
                             # Re-check state after expanding
                             current_state = container_control.CurrentExpandCollapseState
                             is_expanded = (current_state == auto.ExpandCollapseState.Expanded)
                             if not is_expanded:
-                                print(f"[GuiController] Failed to expand container '{container_name}'.")
+                                logger.warning(f"Failed to expand container '{container_name}'.")
                                 # Don't necessarily fail yet, sometimes items are accessible anyway
                 except Exception as exp_err:
-                     print(f"Warning: Error checking/expanding container '{container_name}': {exp_err}")
+                     logger.warning(f"Error checking/expanding container '{container_name}': {exp_err}")
 
                 # --- Find the item ---
                 # Search within the container, potentially needing longer timeout if list is large
@@ -630,7 +621,7 @@ class GuiController(QObject):
                     except LookupError:
                          item_to_select = None # Reset if lookup fails
                     except Exception as item_find_err:
-                         print(f"Warning: Error during item search for '{value_to_select}': {item_find_err}")
+                         logger.warning(f"Error during item search for '{value_to_select}': {item_find_err}")
                          item_to_select = None
                     # If not found, wait briefly
                     time.sleep(0.1)
@@ -643,7 +634,7 @@ class GuiController(QObject):
                 item_name_found = "[Error getting name]"
                 try: item_name_found = item_to_select.Name
                 except Exception: pass
-                print(f"[GuiController] Found item to select: '{item_name_found}'")
+                logger.debug(f"Found item to select: '{item_name_found}'")
 
                 # --- Select the item ---
                 select_success = False
@@ -652,18 +643,18 @@ class GuiController(QObject):
                     if item_to_select.IsSelectionItemPatternAvailable():
                         item_to_select.Select()
                         select_success = True
-                        print(f"[GuiController] Selected item using SelectionItemPattern.")
+                        logger.debug(f"Selected item using SelectionItemPattern.")
                     # Method 2: InvokePattern (Common for menu items)
                     elif item_to_select.IsInvokePatternAvailable():
                          item_to_select.Invoke()
                          select_success = True
-                         print(f"[GuiController] Selected item using InvokePattern.")
+                         logger.debug(f"Selected item using InvokePattern.")
                     # Method 3: Click (Fallback)
                     else:
-                         print(f"[GuiController] Warning: Item '{item_name_found}' supports neither SelectionItem nor Invoke Pattern. Attempting Click().")
+                         logger.warning(f"Item '{item_name_found}' supports neither SelectionItem nor Invoke Pattern. Attempting Click().")
                          item_to_select.Click(waitTime=0.1)
                          select_success = True # Assume click worked if no exception
-                         print(f"[GuiController] Selected item using Click fallback.")
+                         logger.debug(f"Selected item using Click fallback.")
                 except Exception as select_err:
                      self._emit_error(f"Error occurred while trying to select item '{item_name_found}': {select_err}")
                      return False
@@ -678,8 +669,7 @@ class GuiController(QObject):
 
             except Exception as e:
                 err_msg = f"Failed to select item '{value_to_select}' in container '{container_name}': {type(e).__name__} - {e}"
-                self._emit_error(err_msg)
-                traceback.print_exc()
+                self._emit_error(err_msg, exc_info=True)
                 return False
         return False
 
@@ -707,12 +697,12 @@ class GuiController(QObject):
             try: control_name = control.Name
             except Exception: pass
             try:
-                print(f"[GuiController] Attempting to toggle checkbox: '{control_name}' (Target state: {target_state})")
+                logger.debug(f"Attempting to toggle checkbox: '{control_name}' (Target state: {target_state})")
 
                 # Check IsEnabled state first
                 is_enabled = False
                 try: is_enabled = control.IsEnabled
-                except Exception: print(f"Warning: Could not get IsEnabled state for control '{control_name}'")
+                except Exception: logger.warning(f"Could not get IsEnabled state for control '{control_name}'")
                 if not is_enabled:
                      self._emit_error(f"Cannot toggle checkbox '{control_name}': Control is disabled.")
                      return False
@@ -720,13 +710,13 @@ class GuiController(QObject):
                 # Check TogglePattern availability
                 has_toggle_pattern = False
                 try: has_toggle_pattern = control.IsTogglePatternAvailable()
-                except Exception: print(f"Warning: Could not check TogglePattern for control '{control_name}'")
+                except Exception: logger.warning(f"Could not check TogglePattern for control '{control_name}'")
                 if not has_toggle_pattern:
                     # Fallback: Try clicking the checkbox if TogglePattern is unavailable
-                    print(f"Warning: Checkbox '{control_name}' does not support TogglePattern. Attempting Click() fallback.")
+                    logger.warning(f"Checkbox '{control_name}' does not support TogglePattern. Attempting Click() fallback.")
                     try:
                         control.Click(waitTime=0.1)
-                        print(f"[GuiController] Toggle attempted via Click fallback.")
+                        logger.debug(f"Toggle attempted via Click fallback.")
                         # Cannot verify state reliably after click fallback
                         return True
                     except Exception as click_err:
@@ -736,21 +726,21 @@ class GuiController(QObject):
                 # Use TogglePattern
                 current_state_enum = auto.ToggleState.Indeterminate # Default
                 try: current_state_enum = control.GetTogglePattern().CurrentToggleState
-                except Exception as get_state_err: print(f"Warning: Could not get toggle state for '{control_name}': {get_state_err}")
+                except Exception as get_state_err: logger.warning(f"Could not get toggle state for '{control_name}': {get_state_err}")
 
                 # Convert enum to boolean (On -> True, Off/Indeterminate -> False for simple comparison)
                 current_state_bool = bool(current_state_enum == auto.ToggleState.On)
-                print(f"[GuiController] Current checkbox state: {current_state_enum} (Interpreted as Bool: {current_state_bool})")
+                logger.debug(f"Current checkbox state: {current_state_enum} (Interpreted as Bool: {current_state_bool})")
 
                 needs_toggle = True
                 if target_state is not None: # If a specific target state is requested
                     needs_toggle = (target_state != current_state_bool)
-                    print(f"[GuiController] Target state specified ({target_state}). Needs toggle: {needs_toggle}")
+                    logger.debug(f"Target state specified ({target_state}). Needs toggle: {needs_toggle}")
 
                 if needs_toggle:
-                    print(f"[GuiController] Toggling checkbox '{control_name}'...")
+                    logger.debug(f"Toggling checkbox '{control_name}'...")
                     control.Toggle()
-                    print(f"[GuiController] Toggle executed.")
+                    logger.debug(f"Toggle executed.")
                     time.sleep(0.1) # Pause after action
                     # Verify state if target was specified
                     if target_state is not None:
@@ -760,18 +750,17 @@ class GuiController(QObject):
                         final_state_bool = bool(final_state_enum == auto.ToggleState.On)
                         if final_state_bool != target_state:
                              # Report mismatch but consider the toggle action itself successful if no exception occurred
-                             print(f"Warning: Checkbox '{control_name}' state ({final_state_bool}) did not match target state ({target_state}) after toggle.")
+                             logger.warning(f"Checkbox '{control_name}' state ({final_state_bool}) did not match target state ({target_state}) after toggle.")
                         else:
-                             print(f"[GuiController] Verified state matches target ({target_state}).")
+                             logger.debug(f"Verified state matches target ({target_state}).")
                 else:
-                    print(f"[GuiController] Checkbox '{control_name}' is already in the desired state ({current_state_bool}, matches target {target_state}). No toggle needed.")
+                    logger.debug(f"Checkbox '{control_name}' is already in the desired state ({current_state_bool}, matches target {target_state}). No toggle needed.")
 
                 return True # Return True if toggle was executed or not needed
 
             except Exception as e:
                 err_msg = f"Failed to toggle checkbox '{control_name}': {type(e).__name__} - {e}"
-                self._emit_error(err_msg)
-                traceback.print_exc()
+                self._emit_error(err_msg, exc_info=True)
                 return False
         return False
 
@@ -791,7 +780,7 @@ class GuiController(QObject):
             try: control_name = control.Name
             except Exception: pass
             try:
-                print(f"[GuiController] Getting state for control: '{control_name}'")
+                logger.debug(f"Getting state for control: '{control_name}'")
                 state_info: Dict[str, Any] = {}
 
                 # --- Safely get common properties ---
@@ -814,12 +803,12 @@ class GuiController(QObject):
                              state_info['ToggleState'] = toggle_state.name # Store enum name string
                         else: state_info['ToggleState'] = str(toggle_state)
                         state_info['IsChecked'] = bool(toggle_state == auto.ToggleState.On)
-                except Exception as e: print(f"Warning getting TogglePattern state: {e}")
+                except Exception as e: logger.warning(f"Could not get TogglePattern state: {e}")
 
                 try:
                     if safe_get('IsSelectionItemPatternAvailable', False):
                         state_info['IsSelected'] = safe_get('IsSelected', False) # Direct property from pattern interface
-                except Exception as e: print(f"Warning getting SelectionItemPattern state: {e}")
+                except Exception as e: logger.warning(f"Could not get SelectionItemPattern state: {e}")
 
                 try:
                     if safe_get('IsExpandCollapsePatternAvailable', False):
@@ -827,26 +816,25 @@ class GuiController(QObject):
                          if hasattr(exp_state, 'name'): state_info['ExpandCollapseState'] = exp_state.name
                          else: state_info['ExpandCollapseState'] = str(exp_state)
                          state_info['IsExpanded'] = bool(exp_state == auto.ExpandCollapseState.Expanded)
-                except Exception as e: print(f"Warning getting ExpandCollapsePattern state: {e}")
+                except Exception as e: logger.warning(f"Could not get ExpandCollapsePattern state: {e}")
 
                 try:
                     if safe_get('IsValuePatternAvailable', False):
                          state_info['Value'] = safe_get('CurrentValue', '') # Get value if available
                          state_info['IsReadOnly'] = safe_get('IsReadOnly', True) # Assume read-only if pattern exists but property fails
-                except Exception as e: print(f"Warning getting ValuePattern state: {e}")
+                except Exception as e: logger.warning(f"Could not get ValuePattern state: {e}")
 
                 try:
                     rect = safe_get('BoundingRectangle')
                     state_info['BoundingRect'] = rect.tuple() if rect else None
-                except Exception as e: print(f"Warning getting BoundingRectangle state: {e}")
+                except Exception as e: logger.warning(f"Could not get BoundingRectangle state: {e}")
 
 
-                print(f"[GuiController] Get state successful: {state_info}")
+                logger.debug(f"Get state successful: {state_info}")
                 return state_info
 
             except Exception as e:
                 err_msg = f"Failed to get state for control '{control_name}': {type(e).__name__} - {e}"
-                self._emit_error(err_msg)
-                traceback.print_exc()
+                self._emit_error(err_msg, exc_info=True)
                 return None # Return None on error
         return None # Return None if control not found
\ No newline at end of file
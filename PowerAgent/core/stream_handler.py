@@ -1,155 +1,314 @@
 # ========================================
 # 文件名: PowerAgent/core/stream_handler.py
-# (CORRECTED - Improved termination logic & error handling)
+# (REWRITTEN - Single-thread selector pump replaces per-stream StreamWorker threads,
+#  pooled QRunnable readers for pipes that cannot be polled)
 # ----------------------------------------
 # core/stream_handler.py
 # -*- coding: utf-8 -*-
 
 """
-Handles reading from subprocess streams asynchronously.
+Handles reading from subprocess streams while the process runs.
+Where pipes can be polled, both are multiplexed with one selector on the calling
+thread. Elsewhere (Windows) each pipe is drained by a runnable on a shared thread
+pool, so no reader threads are created per command.
 """
 
 import os
-import platform
-import traceback
-import io
-import time # Import time for sleep
-from PySide6.QtCore import QObject, Signal, QThread
-
-class StreamWorker(QObject):
-     finished = Signal()
-     output_ready = Signal(bytes) # Emits raw bytes
-
-     def __init__(self, stream, stop_flag_func, line_list=None, filter_clixml=False):
-         """
-         Worker to read from a stream non-blockingly using os.read.
-
-         Args:
-             stream: The stream object (e.g., process.stdout, process.stderr).
-             stop_flag_func: A callable function that returns True if the worker should stop (external signal).
-             line_list (optional): A list to append raw chunks to (used for stderr checking later).
-             filter_clixml (optional): If True on Windows, attempts to filter out CLIXML error messages.
-         """
-         super().__init__()
-         self.stream = stream
-         self.external_stop_flag_func = stop_flag_func # Rename for clarity
-         self._should_stop = False # Internal flag for explicit stop
-         self.line_list = line_list
-         self.filter_clixml = filter_clixml and platform.system() == "Windows"
-         self.stream_fd = -1
-         self.stream_name = "Unknown" # For logging
-
-         if hasattr(stream, 'fileno'):
-             try:
-                 self.stream_fd = stream.fileno()
-                 # Determine stream name for logging
-                 if stream is getattr(stream, '__stdout__', None): self.stream_name = "stdout"
-                 elif stream is getattr(stream, '__stderr__', None): self.stream_name = "stderr"
-                 else: self.stream_name = f"FD {self.stream_fd}"
-             except (OSError, ValueError, io.UnsupportedOperation) as e:
-                 print(f"[StreamWorker {self.stream_name}] Warning: Could not get fileno: {e}. os.read unavailable.")
-         else:
-              self.stream_name = type(stream).__name__
-              print(f"[StreamWorker {self.stream_name}] Warning: Stream object has no fileno attribute.")
-
-
-     def stop(self):
-         """Signals the worker to stop its loop."""
-         self._should_stop = True
-         print(f"[StreamWorker {self.stream_name}] Stop signal received internally.")
-
-     def run(self):
-         """Reads from the stream and emits data until EOF or stop signal."""
-         print(f"[StreamWorker {self.stream_name}] Reader thread started.")
-         try:
-             # Loop while neither external nor internal stop flag is set
-             while not self.external_stop_flag_func() and not self._should_stop:
-                 try:
-                     chunk = None
-                     read_attempted = False
-
-                     if self.stream_fd != -1:
-                         try:
-                             # Use os.read for potentially better non-blocking behavior on pipes
-                             chunk = os.read(self.stream_fd, 4096)
-                             read_attempted = True
-                         except BlockingIOError:
-                             # This is expected if no data is available, sleep briefly
-                             QThread.msleep(20) # Small sleep to yield CPU
-                             continue
-                         except (OSError, ValueError) as e:
-                             # Errors like EBADF (bad file descriptor) likely mean the pipe closed
-                             print(f"[StreamWorker {self.stream_name}] Stream read error (os.read): {e}. Stopping read.")
-                             self._should_stop = True # Ensure loop exit
-                             break # Exit loop
-                     else:
-                         # Fallback using stream.read() - potentially blocking
-                         try:
-                             # Check if stream is closed before attempting read
-                             if hasattr(self.stream, 'closed') and self.stream.closed:
-                                 print(f"[StreamWorker {self.stream_name}] Fallback stream detected as closed.")
-                                 self._should_stop = True
-                                 break
-                             # This might block if stream doesn't support non-blocking reads
-                             chunk = self.stream.read(4096)
-                             read_attempted = True
-                         except io.UnsupportedOperation:
-                             print(f"[StreamWorker {self.stream_name}] Fallback stream read failed: Unsupported operation.")
-                             self._should_stop = True
-                             break
-                         except Exception as read_err:
-                             print(f"[StreamWorker {self.stream_name}] Fallback stream read error: {read_err}")
-                             self._should_stop = True
-                             break
-
-                     # If read was attempted and returned no data, it usually means EOF
-                     if read_attempted and not chunk:
-                         print(f"[StreamWorker {self.stream_name}] EOF detected.")
-                         self._should_stop = True
-                         break # Exit loop
-
-                     # If a chunk was successfully read
-                     if chunk:
-                         # Check flags again *after* potential blocking read
-                         if self.external_stop_flag_func() or self._should_stop:
-                              print(f"[StreamWorker {self.stream_name}] Stop flag set after read, discarding chunk.")
-                              break
-
-                         emit_chunk = True
-                         if self.line_list is not None:
-                             self.line_list.append(chunk) # Store raw chunk
-
-                         if self.filter_clixml:
-                             try:
-                                 if chunk.strip().startswith(b"#< CLIXML"):
-                                     emit_chunk = False
-                                     # print(f"[StreamWorker {self.stream_name}] Filtered potential CLIXML block.") # Debug log
-                             except Exception: pass # Ignore errors during filtering check
-
-                         if emit_chunk:
-                             try:
-                                 self.output_ready.emit(chunk)
-                             except RuntimeError: # Target object likely deleted
-                                 print(f"[StreamWorker {self.stream_name}] Target for signal emission deleted. Stopping.")
-                                 self._should_stop = True
-                                 break
-                     else:
-                        # If no chunk was read (e.g., non-blocking read returned nothing), sleep briefly
-                        QThread.msleep(20)
-
-                 except Exception as e:
-                     print(f"[StreamWorker {self.stream_name}] Unexpected error in read loop: {e}")
-                     traceback.print_exc()
-                     self._should_stop = True # Exit loop on unexpected error
-                     break
-         finally:
-             print(f"[StreamWorker {self.stream_name}] Read loop finished (Should Stop: {self._should_stop}, External Stop: {self.external_stop_flag_func()}).")
-             # Do NOT close the stream here - Popen manages the pipe lifecycle.
-             # Let the command_executor handle closing if necessary (though usually not needed).
-             try:
-                 self.finished.emit()
-                 print(f"[StreamWorker {self.stream_name}] Finished signal emitted.")
-             except RuntimeError:
-                 print(f"[StreamWorker {self.stream_name}] Warning: Could not emit finished signal (target likely deleted).")
-             except Exception as sig_err:
-                  print(f"[StreamWorker {self.stream_name}] Error emitting finished signal: {sig_err}")
\ No newline at end of file
+import re
+import selectors
+import threading
+import time
+import logging
+from typing import Callable, Dict, Optional
+from PySide6.QtCore import QRunnable, QThreadPool
+
+# --- Get Logger ---
+logger = logging.getLogger(__name__)
+
+# PowerShell prefixes serialized error records on stderr with this sentinel (after optional whitespace),
+# followed by one <Objs ...>...</Objs> line. Matching the compiled pattern avoids a stripped copy of the batch.
+_CLIXML_SENTINEL_RE = re.compile(rb"^\s*#< CLIXML")
+_CLIXML_SCAN_LIMIT = 64 # Only the head of a batch is examined, however much leading whitespace it has
+_CLIXML_END = b"</Objs>"
+
+_READ_CHUNK_SIZE = 65536 # One read drains a full default Linux pipe buffer
+_SELECT_TIMEOUT = 0.1 # Seconds; bounds how long a stop request can go unnoticed
+_MAX_PENDING_BYTES = 65536 # Emit an unterminated line once it grows this large
+_COALESCE_BYTES = 16384 # Release buffered lines at once when this much is waiting...
+_COALESCE_INTERVAL = 0.03 # ...or when this many seconds passed since the last release
+_READER_POOL_SIZE = 4 # Two readers per command; room for a manual and an AI command at once
+
+_PROCESS_EXITED = object() # Selector key data marking the pidfd registration
+_WAKE_UP = object() # Selector key data marking the wake-up pipe written by ProcessStreamPump.wake_all()
+
+def _open_pidfd(pid: int) -> Optional[int]:
+    """Returns an fd that becomes readable when the process exits (Linux 5.3+), else None."""
+    pidfd_open = getattr(os, 'pidfd_open', None)
+    if pidfd_open is None: return None
+    try:
+        return pidfd_open(pid)
+    except OSError as e:
+        logger.debug(f"pidfd_open unavailable for PID {pid}: {e}. Waiting for pipe EOF only.")
+        return None
+
+class _LineBuffer:
+    """Accumulates pipe output and releases it on line boundaries."""
+    __slots__ = ("_pending", "_last_release")
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._last_release = 0.0 # Monotonic time of the last release; 0 lets the first output through at once
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def append(self, chunk):
+        """Appends bytes or a memoryview slice of a read buffer (copied straight into the pending bytearray)."""
+        self._pending.extend(chunk)
+
+    def is_due(self, now: float) -> bool:
+        """True when buffered output should be released now instead of being coalesced with later reads."""
+        return len(self._pending) >= _COALESCE_BYTES or now - self._last_release >= _COALESCE_INTERVAL
+
+    def release(self) -> bytes:
+        """Returns every complete buffered line (or an oversized partial line), else b""."""
+        pending = self._pending
+        cut = pending.rfind(b"\n")
+        if cut >= 0:
+            data = bytes(pending[:cut + 1])
+            del pending[:cut + 1]
+        elif len(pending) >= _MAX_PENDING_BYTES:
+            data = bytes(pending)
+            pending.clear()
+        else:
+            return b""
+        self._last_release = time.monotonic()
+        return data
+
+    def flush(self) -> bytes:
+        """Returns and clears whatever is buffered."""
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
+
+class ProcessStreamPump:
+    """
+    Reads a process' stdout and stderr pipes with a single selector and forwards the data
+    to callbacks. Output is forwarded on line boundaries so the CLI view does not split lines,
+    and bursts of small writes are coalesced so chatty commands emit fewer UI signals.
+    """
+    _active_wake_fds: set = set() # Write ends of the wake-up pipes of running pumps
+    _active_lock = threading.Lock() # Held while writing to or closing a wake-up pipe
+
+    @classmethod
+    def wake_all(cls):
+        """Interrupts the select() of every running pump so a stop request is seen at once instead of at the next timeout."""
+        with cls._active_lock:
+            for wake_fd in cls._active_wake_fds:
+                try: os.write(wake_fd, b"\0")
+                except (BlockingIOError, OSError): pass # Pipe full: a wake-up is already pending
+
+    def __init__(self, process, stop_flag_func: Callable[[], bool],
+                 on_stdout: Callable[[bytes], None], on_stderr: Callable[[bytes], None]):
+        """
+        Args:
+            process: The subprocess.Popen object whose stdout/stderr are PIPEs.
+            stop_flag_func: A callable that returns True if reading should stop.
+            on_stdout: Called with each batch of stdout bytes.
+            on_stderr: Called with each batch of stderr bytes.
+        """
+        self._process = process
+        self._stop_flag_func = stop_flag_func
+        self._on_stdout = on_stdout
+        self._on_stderr = on_stderr
+        self._pending: Dict[int, _LineBuffer] = {} # fd -> trailing partial line
+        self._callbacks: Dict[int, Callable[[bytes], None]] = {}
+        # Reads land in one preallocated buffer and are copied straight into the line buffers, so no bytes object is created per read
+        self._read_buffer = bytearray(_READ_CHUNK_SIZE)
+        self._read_view = memoryview(self._read_buffer)
+
+    def run(self) -> bool:
+        """
+        Pumps both pipes until EOF on each. Where the process exit can be watched (Linux pidfd),
+        pumping also ends once the process exits, so background children that inherited the
+        pipes do not hold the command open.
+        Returns:
+            bool: True if reading finished, False if the stop flag interrupted reading.
+        """
+        pidfd = _open_pidfd(self._process.pid)
+        wake_r, wake_w = os.pipe(); os.set_blocking(wake_r, False); os.set_blocking(wake_w, False)
+        with self._active_lock: self._active_wake_fds.add(wake_w)
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(wake_r, selectors.EVENT_READ, _WAKE_UP)
+                for stream, callback in ((self._process.stdout, self._on_stdout), (self._process.stderr, self._on_stderr)):
+                    if stream is None: continue
+                    fd = stream.fileno()
+                    os.set_blocking(fd, False) # A spurious readiness report must never stall the pump in read()
+                    self._pending[fd] = _LineBuffer()
+                    self._callbacks[fd] = callback
+                    selector.register(fd, selectors.EVENT_READ)
+                if pidfd is not None: selector.register(pidfd, selectors.EVENT_READ, _PROCESS_EXITED)
+                logger.debug(f"Stream pump started for PID {self._process.pid} ({len(self._pending)} pipe(s), exit watch: {pidfd is not None}).")
+
+                open_pipes = len(self._pending)
+                while open_pipes:
+                    if self._stop_flag_func():
+                        logger.debug(f"Stream pump for PID {self._process.pid} interrupted by stop flag.")
+                        self.flush()
+                        return False
+                    # Wake up in time to release coalesced output even if the process goes quiet
+                    timeout = _COALESCE_INTERVAL if any(self._pending.values()) else _SELECT_TIMEOUT
+                    for key, _ in selector.select(timeout=timeout):
+                        if key.data is _WAKE_UP:
+                            try: os.read(wake_r, 64) # Consume the wake-up; the stop flag is checked at the top of the loop
+                            except BlockingIOError: pass
+                            continue
+                        if key.data is _PROCESS_EXITED:
+                            # Everything the process wrote is already in the pipe buffers
+                            logger.debug(f"PID {self._process.pid} exited. Draining remaining pipe data.")
+                            for fd in self._pending:
+                                while count := self._read_into_buffer(fd): self._pending[fd].append(self._read_view[:count])
+                            self.flush()
+                            return True
+                        fd = key.fd
+                        line_buffer = self._pending[fd]
+                        # Drain the pipe before selecting again; a short read means it is empty, so EAGAIN is rarely hit
+                        while (count := self._read_into_buffer(fd)):
+                            line_buffer.append(self._read_view[:count])
+                            if count < _READ_CHUNK_SIZE: break
+                        if count == 0: # EOF
+                            selector.unregister(fd)
+                            open_pipes -= 1
+                            self._flush_fd(fd)
+                    self._release_due()
+        finally:
+            if pidfd is not None: os.close(pidfd)
+            with self._active_lock: self._active_wake_fds.discard(wake_w)
+            os.close(wake_r); os.close(wake_w)
+
+        logger.debug(f"Stream pump for PID {self._process.pid} reached EOF on all pipes.")
+        return True
+
+    def flush(self):
+        """Forwards any buffered partial lines."""
+        for fd in self._pending: self._flush_fd(fd)
+
+    def _read_into_buffer(self, fd: int) -> Optional[int]:
+        """Reads into the shared read buffer. Returns the byte count (0 on EOF), or None if the pipe has no data right now."""
+        try:
+            return os.readv(fd, (self._read_buffer,))
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            logger.warning(f"Read error on FD {fd} for PID {self._process.pid}: {e}. Treating as EOF.")
+            return 0
+
+    def _release_due(self):
+        now = time.monotonic()
+        for fd, line_buffer in self._pending.items():
+            if line_buffer and line_buffer.is_due(now):
+                data = line_buffer.release()
+                if data: self._callbacks[fd](data)
+
+    def _flush_fd(self, fd: int):
+        line_buffer = self._pending.get(fd)
+        if line_buffer is None: return
+        data = line_buffer.flush()
+        if data: self._callbacks[fd](data)
+
+
+class _ClixmlFilter:
+    """
+    Removes the CLIXML block PowerShell writes at the start of stderr. Only the first batch is checked for
+    the sentinel; the block is then dropped through the line closing </Objs>, which may arrive in a later batch.
+    """
+    __slots__ = ("_state",)
+
+    def __init__(self):
+        self._state = "check" # "check" (first batch pending), "block" (inside the CLIXML block) or None (pass through)
+
+    def __call__(self, data: bytes) -> bytes:
+        if self._state is None: return data
+        if self._state == "check":
+            if not _CLIXML_SENTINEL_RE.match(data, 0, _CLIXML_SCAN_LIMIT): self._state = None; return data
+            self._state = "block"
+        end = data.find(_CLIXML_END)
+        if end < 0: return b"" # Whole batch is inside the block
+        self._state = None
+        line_end = data.find(b"\n", end)
+        logger.debug("Filtered CLIXML block from stderr.")
+        return data[line_end + 1:] if line_end >= 0 else b""
+
+
+class PipeReader(QRunnable):
+    """
+    Drains a single pipe to EOF on a shared pool thread and forwards the data on line boundaries.
+    Used on Windows, where anonymous pipes cannot be registered with a selector.
+    Bursts are coalesced like in ProcessStreamPump; since the reader blocks in read(), the thread
+    waiting on the process calls release_due() every RELEASE_INTERVAL to forward held output.
+    """
+    RELEASE_INTERVAL = _COALESCE_INTERVAL
+    _pool: Optional[QThreadPool] = None # Shared by all commands so reader threads are reused
+    _pool_lock = threading.Lock() # Two commands starting together must not each create a pool
+
+    @classmethod
+    def start_reading(cls, stream, on_data: Callable[[bytes], None], filter_clixml: bool = False) -> 'PipeReader':
+        """
+        Creates a reader for the stream and queues it on the shared pool.
+        filter_clixml: drop a PowerShell CLIXML block at the start of the stream (use for stderr).
+        """
+        with cls._pool_lock:
+            if cls._pool is None:
+                pool = QThreadPool()
+                pool.setMaxThreadCount(_READER_POOL_SIZE)
+                cls._pool = pool
+                logger.debug(f"Created shared pipe reader pool ({_READER_POOL_SIZE} threads).")
+        reader = cls(stream, on_data, filter_clixml)
+        cls._pool.start(reader)
+        return reader
+
+    def __init__(self, stream, on_data: Callable[[bytes], None], filter_clixml: bool = False):
+        super().__init__()
+        self.setAutoDelete(False) # The caller keeps the reference and waits on it
+        self._stream = stream
+        self._on_data = on_data
+        self._clixml_filter = _ClixmlFilter() if filter_clixml else None
+        self._line_buffer = _LineBuffer()
+        self._lock = threading.Lock() # Guards the buffer and keeps forwarded batches in order
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            read_buffer = bytearray(_READ_CHUNK_SIZE); read_view = memoryview(read_buffer)
+            while True:
+                count = self._stream.readinto(read_buffer) # Unbuffered pipe: a single ReadFile/read call
+                if not count: break # EOF
+                with self._lock:
+                    self._line_buffer.append(read_view[:count])
+                    if self._line_buffer.is_due(time.monotonic()): self._release()
+        except (OSError, ValueError) as e: # Pipe closed underneath us
+            logger.debug(f"Pipe reader stopped early: {e}")
+        except Exception:
+            logger.error("Unexpected error in pipe reader.", exc_info=True)
+        finally:
+            try:
+                with self._lock: self._forward(self._line_buffer.flush())
+            except Exception: logger.error("Error forwarding final pipe data.", exc_info=True)
+            self._done.set()
+
+    def release_due(self):
+        """Forwards coalesced output that has been held for RELEASE_INTERVAL. Called from the waiting thread."""
+        with self._lock:
+            if self._line_buffer and self._line_buffer.is_due(time.monotonic()): self._release()
+
+    def _release(self):
+        self._forward(self._line_buffer.release())
+
+    def _forward(self, data: bytes):
+        if data and self._clixml_filter is not None: data = self._clixml_filter(data)
+        if data: self._on_data(data)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the pipe reached EOF. Returns False if the timeout expired first."""
+        return self._done.wait(timeout)
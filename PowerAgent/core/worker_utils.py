@@ -9,63 +9,51 @@
 Utility functions shared by worker threads.
 """
 
+import codecs
 import locale
 import platform
+import logging
+
+# --- Get Logger ---
+logger = logging.getLogger(__name__)
+
+# Resolved once; platform.system() goes through uname()/the Windows API on every call.
+IS_WINDOWS = platform.system() == "Windows"
+
+# --- Decode Fallback ---
+# The locale does not change while the app runs, so the fallback used after UTF-8 is resolved once:
+# the system preferred encoding, else 'mbcs' (Windows ANSI), else latin-1 (never fails).
+_PREFERRED_ENCODING = locale.getpreferredencoding(False)
+if not _PREFERRED_ENCODING or _PREFERRED_ENCODING.lower().replace('-', '') == 'utf8': _PREFERRED_ENCODING = None # Avoid trying UTF-8 again
+_FALLBACK_ENCODING = _PREFERRED_ENCODING or ('mbcs' if IS_WINDOWS else 'latin-1')
+# Canonical codec name (e.g. 'cp936' -> 'gbk', 'ANSI_X3.4-1968' -> 'ascii'): common ones hit CPython's built-in decoder
+# fast paths and the rest skip name normalization; an unknown locale codec falls back here instead of failing every decode.
+try: _FALLBACK_ENCODING = codecs.lookup(_FALLBACK_ENCODING).name
+except LookupError: _FALLBACK_ENCODING = 'latin-1'
 
 def decode_output(output_bytes: bytes) -> str:
     """
     Attempts to decode bytes, prioritizing UTF-8, then system preferred,
     then 'mbcs' (Windows), finally falling back to latin-1 with replacements.
+    Accepts non-bytes input defensively.
     """
     if not isinstance(output_bytes, bytes):
-        print(f"Warning: decode_output received non-bytes type: {type(output_bytes)}. Returning as is.")
+        logger.warning(f"decode_output received non-bytes type: {type(output_bytes)}. Returning as is.")
         if isinstance(output_bytes, str): return output_bytes
         try: return str(output_bytes)
         except: return repr(output_bytes)
+    return decode_output_bytes(output_bytes)
 
+def decode_output_bytes(output_bytes: bytes) -> str:
+    """
+    Fast path of decode_output for callers that always hold real bytes
+    (pipe reads and Signal(bytes) payloads), so the type check is skipped.
+    """
     if not output_bytes: return ""
-
+    # Plain ASCII decodes identically under every candidate encoding
+    if output_bytes.isascii(): return output_bytes.decode('ascii')
     # 1. Try UTF-8 (most common)
-    try:
-        decoded_str = output_bytes.decode('utf-8')
-        # print("[Decode] Success with utf-8") # Optional debug print
-        return decoded_str
-    except UnicodeDecodeError:
-        # print("[Decode] Failed utf-8, trying system preferred...") # Optional debug print
-        pass # Continue to next attempt
-    except Exception as e:
-        print(f"Error decoding with utf-8: {e}, trying system preferred...")
-        pass # Continue to next attempt
-
-    # 2. Try system preferred encoding (e.g., locale settings)
-    system_preferred = locale.getpreferredencoding(False)
-    if system_preferred and system_preferred.lower() != 'utf-8': # Avoid trying UTF-8 again
-        try:
-            # Use replace to avoid crashing on the second attempt
-            decoded_str = output_bytes.decode(system_preferred, errors='replace')
-            print(f"[Decode] Success with system preferred: {system_preferred}") # Info print
-            return decoded_str
-        except UnicodeDecodeError:
-             print(f"[Decode] Failed system preferred '{system_preferred}', trying mbcs (Windows) or fallback...")
-             pass # Continue to next attempt
-        except Exception as e:
-            print(f"Error decoding with system preferred '{system_preferred}': {e}, trying mbcs (Windows) or fallback...")
-            pass
-
-    # 3. Try 'mbcs' (mainly for Windows ANSI compatibility)
-    if platform.system() == 'Windows':
-        try:
-            # Use replace to avoid crashing here
-            decoded_str = output_bytes.decode('mbcs', errors='replace')
-            print("[Decode] Success with mbcs") # Info print
-            return decoded_str
-        except UnicodeDecodeError:
-             print("[Decode] Failed mbcs, using final fallback latin-1...")
-             pass # Continue to next attempt
-        except Exception as e:
-            print(f"Error decoding with mbcs: {e}, using final fallback latin-1...")
-            pass
-
-    # 4. Final fallback (Latin-1 rarely fails but might not be correct)
-    print("[Decode] Using final fallback: latin-1")
-    return output_bytes.decode('latin-1', errors='replace')
\ No newline at end of file
+    try: return output_bytes.decode('utf-8')
+    except UnicodeDecodeError: pass
+    # 2. Fall back to the encoding resolved at import (never fails with errors='replace')
+    return output_bytes.decode(_FALLBACK_ENCODING, errors='replace')
@@ -7,10 +7,13 @@ import requests
 import time
 import os
 import platform
-import traceback
 import datetime
 import html
 import logging # Import logging
+import functools
+import atexit
+import types
+import threading
 # --- Typing Import ---
 from typing import Optional, Dict, Any, List, Tuple
 # --- End Typing Import ---
@@ -80,12 +83,13 @@ except ImportError:
     def decode_output(b): return repr(b)
 
 try:
-    from .command_executor import execute_command_streamed
+    from .command_executor import execute_command_streamed, wake_running_commands
 except ImportError:
     logger.error("Failed to import '.command_executor'", exc_info=True)
     def execute_command_streamed(*args, **kwargs):
         logger.error("execute_command_streamed is unavailable due to import error.")
         return kwargs.get('cwd', '.'), -1
+    def wake_running_commands(): pass
 
 try:
     # --- Use the GUI specific flag now ---
@@ -118,6 +122,188 @@ except ImportError:
     logger.warning("Failed to import Retry from urllib3.util.retry. Request retries disabled.")
     URLLIB3_RETRY_AVAILABLE = False
 
+# --- Optional fast JSON codec for API payloads ---
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    logger.debug("orjson available for API payload encoding/decoding.")
+except ImportError:
+    orjson = None # type: ignore
+    ORJSON_AVAILABLE = False
+    logger.debug("orjson not installed. Using stdlib json for API payloads.")
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serializes an API payload to UTF-8 JSON bytes."""
+    if ORJSON_AVAILABLE: return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so existing except clauses still apply
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# --- Shared HTTP Session ---
+# Reused across API calls so urllib3 keeps the connection to the model endpoint alive between turns.
+_API_SESSION = requests.Session()
+atexit.register(_API_SESSION.close) # Pooled sockets are closed once, at interpreter shutdown, never per worker
+if URLLIB3_RETRY_AVAILABLE:
+    try:
+        _RETRY_STRATEGY = Retry( total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["POST"])
+        # One adapter for both schemes: a single pool set; few hosts are ever contacted and requests run one at a time per worker
+        _HTTP_ADAPTER = HTTPAdapter(max_retries=_RETRY_STRATEGY, pool_connections=4, pool_maxsize=8)
+        _API_SESSION.mount("https://", _HTTP_ADAPTER); _API_SESSION.mount("http://", _HTTP_ADAPTER)
+        logger.debug("Shared requests session configured with retry strategy.")
+    except Exception as e: logger.warning(f"Could not configure requests retries: {e}")
+else: logger.debug("Requests retries not available or disabled.")
+
+# --- System Prompt Templates ---
+# The OS and shell cannot change while the app runs, so they are baked in once at import.
+# Only the CWD, timestamp and iteration limit are filled in per request.
+_PROMPT_OS_NAME = platform.system()
+_PROMPT_SHELL_TYPE = "PowerShell" if _PROMPT_OS_NAME == "Windows" else "Default Shell"
+_BASE_INSTRUCTIONS_TEMPLATE = (
+    f"You are an AI assistant interacting with a user's computer ({_PROMPT_OS_NAME}). "
+    f"You are operating within {_PROMPT_SHELL_TYPE} on {_PROMPT_OS_NAME}. Your goal is to fulfill user requests by executing actions. "
+    "Prioritize actions in this order: 1. `<cmd>` (Shell Command), 2. `<keyboard>` (Keyboard Simulation - Windows ONLY), 3. `<gui_action>` (GUI Control - Windows ONLY).\n"
+    "Current Working Directory (CWD): '{cwd}'\n"
+    "{timestamp_info}"
+    "**ACTION RULES:**\n" # ... (rest of rules) ...
+    "**UI 信息 (Windows ONLY, 可选):**\n" # ... (UI info explanation) ...
+    "**General Instructions:**\n" # ... (general instructions) ...
+)
+# Split at the timestamp so a timestamped prompt is assembled from cached halves instead of re-formatted and re-serialized per call
+_SYSTEM_PROMPT_HEAD_TEMPLATE, _SYSTEM_PROMPT_TAIL = _BASE_INSTRUCTIONS_TEMPLATE.split("{timestamp_info}")
+_SYSTEM_MESSAGE_JSON_PREFIX = b'{"role":"system","content":'
+_TIMESTAMP_PREFIX = "Current date and time: "
+_MULTI_STEP_FLOW_TEMPLATE = """
+
+**Iterative Operation Mode:**
+- You are in a multi-step process. Your previous action's outcome (or UI info) is in the history (System message).
+- Max consecutive actions: {max_iterations}.
+- **Your Task:** Analyze history/outcome/UI info. Determine the **single next action** (`<cmd>`, `<keyboard>`, `<gui_action>`, or `<get_ui_info>`).
+- If task complete, provide final **textual confirmation/summary** (in Chinese) with NO action tags.
+- If error occurred, try to correct or inform user.
+- **Remember:** Only provide the *next single step* or the *final textual response*.
+**请根据上一步操作的结果/UI信息决定下一步操作 (`<cmd>`, `<keyboard>`, `<gui_action>`, `<get_ui_info>`) 或提供最终的中文文本回复。**
+"""
+_SINGLE_STEP_FLOW_INSTRUCTIONS = """
+
+**Single Operation Mode:**
+- Analyze user request and potentially provided UI info. Provide the single best action (`<cmd>`, `<keyboard>`, `<gui_action>`, `<get_ui_info>`) OR a textual response.
+- No follow-up API call after action execution.
+"""
+
+# --- Action Tag Patterns (compiled once; applied to every model reply) ---
+# One pattern per action tag, in priority order (a reply holding several tags runs the first that matches).
+# Each is wrapped in a group named after the tag, so match.lastgroup tells the caller which one matched.
+_ACTION_RES = (
+    ("<cmd", re.compile(r"(?P<cmd><cmd>\s*(?P<cmd_body>.*?)\s*</cmd>)", re.DOTALL | re.IGNORECASE)),
+    ("<keyboard", re.compile(r"""(?P<keyboard><keyboard\s+call=['"](?P<kb_call>[^'"]+)['"]\s+(?:key=['"](?P<kb_key>[^'"]+)['"]|text=['"](?P<kb_text>.*?)['"]|keys=['"](?P<kb_keys>[^'"]+)['"])\s*/>)""", re.DOTALL | re.IGNORECASE)),
+    ("<gui_action", re.compile(r"""(?P<gui_action><gui_action\s+call=['"](?P<gui_call>[^'"]+)['"]\s+args=['"](?P<gui_args>.*?)['"]\s*/>)""", re.DOTALL | re.IGNORECASE)),
+    ("<get_ui_info", re.compile(r"(?P<get_ui_info><get_ui_info\s*(?P<ui_params>.*?)\s*/>)", re.IGNORECASE)),
+)
+# Tags removed from a reply before it is shown in the chat
+_ACTION_STRIP_RES = (
+    re.compile(r"<cmd>.*?</cmd>", re.DOTALL | re.IGNORECASE),
+    re.compile(r"<gui_action\s+call=.*?/>", re.DOTALL | re.IGNORECASE),
+    re.compile(r"<keyboard\s+call=.*?/>", re.DOTALL | re.IGNORECASE),
+    re.compile(r"<get_ui_info\s*.*?/>", re.DOTALL | re.IGNORECASE),
+)
+_CONTINUE_STRIP_RE = re.compile(r"<continue />", re.DOTALL | re.IGNORECASE)
+# get_ui_info parameter parser
+_UI_PARAM_RE = re.compile(r"(\w+)=['\"]([^'\"]+)['\"]") # One pass over key="value" pairs
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE) # Reasoning blocks, dropped from replies and history
+
+_THINK_OPEN_TAG, _THINK_CLOSE_TAG = "<think>", "</think>"
+
+def _strip_think(text: str) -> str:
+    """
+    Removes <think>...</think> blocks (any case) with str.find() scans over a lower-cased shadow copy,
+    copying the runs between blocks. Linear, and text without any tag (most messages) returns at once.
+    """
+    if "<" not in text: return text
+    shadow = text.lower()
+    # A few non-ASCII characters change length when lower-cased, and IGNORECASE matches a dotless i to "i": use the regex then
+    if len(shadow) != len(text) or "\u0131" in shadow: return _THINK_RE.sub("", text)
+    parts, pos = [], 0
+    while (start := shadow.find(_THINK_OPEN_TAG, pos)) >= 0:
+        end = shadow.find(_THINK_CLOSE_TAG, start + len(_THINK_OPEN_TAG))
+        if end < 0: break # Unterminated block is kept, as with the regex
+        parts.append(text[pos:start]); pos = end + len(_THINK_CLOSE_TAG)
+    if not pos: return text
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def _find_action(reply: str) -> Optional[re.Match]:
+    r"""
+    Returns the match of the highest-priority action tag (<cmd>, then <keyboard>, <gui_action>, <get_ui_info>),
+    or None. match.lastgroup names the tag. Each tag is searched separately: a malformed lower-priority tag
+    must not hide a <cmd> (a lazy text=/args= group can run past its own tag and swallow one).
+
+    >>> _find_action('<keyboard call="type" text="hello">\nThen run <cmd>dir</cmd> and press <keyboard call="press" key="enter" />').lastgroup
+    'cmd'
+    >>> _find_action('<gui_action call="click" args=\'{"x":1}\'>\n<cmd>dir</cmd>\n<gui_action call="a" args="b" />').lastgroup
+    'cmd'
+    """
+    if "<" not in reply: return None # Plain text reply: no tag can match
+    lowered = reply.lower()
+    # A pattern whose tag prefix is absent is skipped without a regex scan. The check is only trusted when
+    # lower-casing is one-to-one and there is no dotless i (IGNORECASE matches it to "i").
+    gated = len(lowered) == len(reply) and "\u0131" not in lowered
+    for prefix, pattern in _ACTION_RES:
+        if gated and prefix not in lowered: continue
+        if (match := pattern.search(reply)): return match
+    return None
+
+@functools.lru_cache(maxsize=256)
+def _strip_action_tags(text: str, strip_continue: bool) -> str:
+    """
+    Returns the reply as shown in the chat: action tags (and optionally <continue />) removed, whitespace trimmed.
+    Cached, since retries and idle multi-step turns repeat the same reply.
+    """
+    if "<" not in text: return text.strip() # No tag to remove
+    for pattern in (_ACTION_STRIP_RES + (_CONTINUE_STRIP_RE,) if strip_continue else _ACTION_STRIP_RES):
+        text = pattern.sub("", text).strip()
+    return text
+
+# Tags that hide their content from the chat; a preview is cut where one of them is still open
+_PREVIEW_HIDDEN_TAGS = ("<think", "<cmd", "<keyboard", "<gui_action", "<get_ui_info", "<continue")
+
+def _preview_text(partial: str) -> str:
+    """
+    Display form of a reply that is still streaming. Finished <think> blocks and action tags are removed as in
+    the final display, and the text is cut where a tag is still open (or its name is still arriving).
+    """
+    if "<" not in partial: return partial
+    text = _strip_think(partial)
+    for pattern in _ACTION_STRIP_RES + (_CONTINUE_STRIP_RE,): text = pattern.sub("", text)
+    lowered = text.lower()
+    if len(lowered) != len(text): lowered = text # Offsets must line up with text
+    cut = min((pos for tag in _PREVIEW_HIDDEN_TAGS if (pos := lowered.find(tag)) >= 0), default=len(text))
+    tail = lowered.rfind("<", 0, cut)
+    if tail >= 0 and any(tag.startswith(lowered[tail:cut]) for tag in _PREVIEW_HIDDEN_TAGS): cut = tail # e.g. "<thi" at the end
+    return text[:cut]
+
+# History roles sent to the API as-is; every other role becomes "system"
+_API_ROLE_MAP = {"user": "user", "assistant": "assistant"}
+
+@functools.lru_cache(maxsize=512)
+def _prepare_history_message(role: str, message: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+    """
+    Returns the API message for a history entry and its serialized form, or None if it is empty once cleaned.
+    Every turn starts a new worker that resends the whole conversation, so entries are cleaned and serialized once per session, not once per turn.
+    """
+    cleaned_message = _strip_think(message).strip()
+    if not cleaned_message: return None
+    api_message = {"role": _API_ROLE_MAP.get(role.lower(), "system"), "content": cleaned_message}
+    return api_message, _json_dumps(api_message)
+
+# --- CLI Message Prefixes (pre-encoded; only the variable part is encoded per message) ---
+_MODEL_ECHO_PREFIX = b"Model " # AI command echo: "Model <cwd>> <command>"
+_MANUAL_ERROR_PREFIX = "错误: ".encode('utf-8')
+
+# --- Streaming Preview Throttle ---
+_PARTIAL_EMIT_INTERVAL = 0.05 # Seconds between preview updates while a reply streams in...
+_PARTIAL_EMIT_DELTAS = 32 # ...unless this many deltas arrived since the last update
+
 # --- Key Mapping (Lowercase key names to auto.Keys constants) ---
 KEY_MAPPING = {}
 if UIAUTOMATION_AVAILABLE_FOR_KEYBOARD and auto: # Check keyboard flag
@@ -154,6 +340,14 @@ if UIAUTOMATION_AVAILABLE_FOR_KEYBOARD and auto: # Check keyboard flag
     }
 else:
      logger.debug("Keyboard automation not available, skipping key mapping.")
+KEY_MAPPING = types.MappingProxyType(KEY_MAPPING) # Read-only view; never changes after import
+_MODIFIER_KEY_NAMES = frozenset(('ctrl', 'control', 'alt', 'menu', 'shift', 'win', 'windows')) # Hotkey names held down around the main key
+
+# --- GUI Action Dispatch (GuiController method name -> True if it returns a value, False if it returns success) ---
+_GUI_DISPATCH = {
+    'click_control': False, 'set_text': False, 'select_item': False, 'toggle_checkbox': False,
+    'get_text': True, 'get_control_state': True, # Return None on failure
+}
 
 # --- Worker Threads ---
 
@@ -161,6 +355,7 @@ class ApiWorkerThread(QThread):
     """Handles AI interaction, response parsing, and action execution (commands/keyboard/GUI)."""
     # (Signals remain the same)
     api_result = Signal(str, float) # (reply_for_display, elapsed_time)
+    api_partial_result = Signal(str) # Reply text received so far while the response streams in
     cli_output_signal = Signal(bytes)
     cli_error_signal = Signal(bytes)
     directory_changed_signal = Signal(str, bool) # (new_dir, is_manual)
@@ -173,13 +368,21 @@ class ApiWorkerThread(QThread):
         self._api_key = api_key # Keep API key internal, do not log directly
         self._api_url = api_url.rstrip('/') if api_url else ""
         self._model_id = model_id
-        self._history = [list(item) if isinstance(item, (list, tuple)) and len(item) == 2 else ["unknown", str(item)] for item in history]
+        # Entries are only read (never modified in place), so well-formed pairs are shared with the caller instead of copied one by one.
+        # The outer list stays private because outcomes are appended to it.
+        self._history = [item if isinstance(item, (list, tuple)) and len(item) == 2 else ("unknown", str(item)) for item in history]
         self._cwd = cwd
         self._is_running = True
+        self._stop_event = threading.Event() # Set by stop(); ends _pause() early
         self._gui_controller: Optional['GuiController'] = None
         self._action_outcome_message: str = ""
         self._keyboard_available = UIAUTOMATION_AVAILABLE_FOR_KEYBOARD
         self._gui_available = UIAUTOMATION_AVAILABLE_FOR_GUI
+        self._system_message_cache_key: Optional[Tuple[str, bool, int]] = None
+        self._system_message_cache: Optional[Tuple[str, str, bytes, bytes]] = None # Prompt text before/after the timestamp, and the same as JSON string fragments
+        self._history_messages: List[Dict[str, str]] = [] # API messages for self._history[:self._history_messages_count]
+        self._history_messages_json: List[bytes] = [] # The same messages, already serialized
+        self._history_messages_count = 0
 
         # Log initialization parameters (mask sensitive data)
         logger.debug("ApiWorkerThread Init Params:")
@@ -199,29 +402,34 @@ class ApiWorkerThread(QThread):
     def stop(self):
         logger.info("ApiWorkerThread stop() called. Setting internal flag.")
         self._is_running = False
+        self._stop_event.set()
+        wake_running_commands() # A command being streamed notices the flag at once instead of at its next select timeout
+
+    def _pause(self, seconds: float):
+        """Waits between actions; returns at once if the worker is (or gets) stopped."""
+        if self._is_running: self._stop_event.wait(seconds)
+
+    def _append_history_if_new(self, role: str, content: str) -> bool:
+        """Appends [role, content] unless it repeats the last history entry. Returns True if appended."""
+        if self._history:
+            last_role, last_content = self._history[-1][0], self._history[-1][1]
+            # Role is compared first; the string compare only runs for a same-role neighbour and stops at the first difference
+            if last_role.lower() == role and last_content == content: return False
+        self._history.append([role, content])
+        return True
 
     def _update_history_with_outcome(self, ai_reply_cleaned: str):
         """Adds AI reply (if new) and action outcome to history."""
         # Add AI reply if it's non-empty and different from the last assistant message
         if ai_reply_cleaned:
-            last_msg_role = self._history[-1][0].lower() if self._history else None
-            last_msg_content = self._history[-1][1] if self._history else None
-            if last_msg_role != 'assistant' or last_msg_content != ai_reply_cleaned:
-                 logger.debug("Adding AI reply (cleaned) to history.")
-                 self._history.append(["assistant", ai_reply_cleaned])
-            else:
-                 logger.debug("Skipping duplicate AI reply in history.")
+            if self._append_history_if_new("assistant", ai_reply_cleaned): logger.debug("Adding AI reply (cleaned) to history.")
+            else: logger.debug("Skipping duplicate AI reply in history.")
 
         # Add action outcome if it exists
         if self._action_outcome_message:
             logger.info(f"Adding action outcome to history: {self._action_outcome_message[:100]}...")
-            last_msg_role = self._history[-1][0].lower() if self._history else None
-            last_msg_content = self._history[-1][1] if self._history else None
-            if last_msg_role != 'system' or last_msg_content != self._action_outcome_message:
-                logger.debug("Appending system message with action outcome to history.")
-                self._history.append(["system", self._action_outcome_message])
-            else:
-                 logger.debug("Skipping duplicate system outcome message in history.")
+            if self._append_history_if_new("system", self._action_outcome_message): logger.debug("Appending system message with action outcome to history.")
+            else: logger.debug("Skipping duplicate system outcome message in history.")
             self._action_outcome_message = "" # Clear after adding
 
     def _try_delete_gui_controller(self):
@@ -330,22 +538,20 @@ class ApiWorkerThread(QThread):
                 raw_model_reply = "错误: API 调用已取消。"
 
             reply_for_display, reply_for_parsing = raw_model_reply or "", raw_model_reply or ""
-            try:
-                logger.debug("Cleaning <think> tags from reply...")
-                temp_cleaned_reply = re.sub(r"<think>.*?</think>", "", reply_for_parsing, flags=re.DOTALL | re.IGNORECASE).strip()
-                reply_for_display, reply_for_parsing = temp_cleaned_reply, temp_cleaned_reply
-                logger.debug(f"Reply after <think> cleaning: {reply_for_display[:200]}...")
-            except Exception as clean_err:
-                logger.warning("Error cleaning <think> tags.", exc_info=True)
+            skip_parse = not reply_for_parsing or reply_for_parsing.startswith("错误:") # Empty or error reply: nothing to clean or parse
+            if not skip_parse:
+                try:
+                    logger.debug("Cleaning <think> tags from reply...")
+                    temp_cleaned_reply = _strip_think(reply_for_parsing).strip()
+                    reply_for_display, reply_for_parsing = temp_cleaned_reply, temp_cleaned_reply
+                    logger.debug(f"Reply after <think> cleaning: {reply_for_display[:200]}...")
+                except Exception as clean_err:
+                    logger.warning("Error cleaning <think> tags.", exc_info=True)
 
             # --- Emit Result ---
             if self._is_running:
                  logger.debug("Cleaning action tags for UI display...")
-                 display_text_for_emit = reply_for_display # Start with think-cleaned version
-                 actions_to_clean = [r"<cmd>.*?</cmd>", r"<gui_action\s+call=.*?/>", r"<keyboard\s+call=.*?/>", r"<get_ui_info\s*.*?/>", r"<continue />"]
-                 for pattern in actions_to_clean:
-                     try: display_text_for_emit = re.sub(pattern, "", display_text_for_emit, flags=re.DOTALL | re.IGNORECASE).strip()
-                     except Exception as action_clean_err: logger.warning(f"Error cleaning pattern '{pattern}': {action_clean_err}")
+                 display_text_for_emit = reply_for_display if skip_parse else _strip_action_tags(reply_for_display, True) # Think-cleaned text without action tags
                  # Ensure we emit something, even if it's the raw reply or error
                  display_text_to_emit = display_text_for_emit if display_text_for_emit else raw_model_reply
                  if "错误:" in raw_model_reply and "错误:" not in display_text_to_emit: display_text_to_emit = raw_model_reply # Prioritize showing errors
@@ -359,32 +565,30 @@ class ApiWorkerThread(QThread):
 
             command_to_run, keyboard_action_to_run, gui_action_to_run, get_ui_request = None, None, None, None
             action_parsed = False
-            if reply_for_parsing and isinstance(reply_for_parsing, str) and "错误:" not in raw_model_reply:
+            if not skip_parse and reply_for_parsing and "错误:" not in raw_model_reply:
                 logger.info("Parsing reply for actions...")
                 try:
                     # --- Action Parsing Logic (Same as before, just added logging) ---
-                    command_match = re.search(r"<cmd>\s*(.*?)\s*</cmd>", reply_for_parsing, re.DOTALL | re.IGNORECASE)
-                    keyboard_match = re.search(r"""<keyboard\s+call=['"]([^'"]+)['"]\s+(?:key=['"]([^'"]+)['"]|text=['"](.*?)['"]|keys=['"]([^'"]+)['"])\s*/>""", reply_for_parsing, re.VERBOSE | re.DOTALL | re.IGNORECASE)
-                    gui_match = re.search(r"""<gui_action\s+call=['"]([^'"]+)['"]\s+args=['"](.*?)['"]\s*/>""", reply_for_parsing, re.VERBOSE | re.DOTALL | re.IGNORECASE)
-                    get_ui_info_match = re.search(r"<get_ui_info\s*(.*?)\s*/>", reply_for_parsing, re.IGNORECASE)
+                    action_match = _find_action(reply_for_parsing)
+                    action_kind = action_match.lastgroup if action_match else None
 
-                    if command_match:
-                        command_to_run = command_match.group(1).strip() or None
+                    if action_kind == "cmd":
+                        command_to_run = action_match.group("cmd_body").strip() or None
                         if command_to_run: logger.info(f"Command action parsed: '{command_to_run}'"); action_parsed = True
-                    elif keyboard_match:
-                        kb_call = keyboard_match.group(1).strip().lower(); kb_key = keyboard_match.group(2); kb_text = keyboard_match.group(3); kb_keys = keyboard_match.group(4)
+                    elif action_kind == "keyboard":
+                        kb_call, kb_key, kb_text, kb_keys = action_match.group("kb_call", "kb_key", "kb_text", "kb_keys"); kb_call = kb_call.strip().lower()
                         keyboard_action_to_run = {"call": kb_call}
                         if kb_key is not None: keyboard_action_to_run["key"] = kb_key.strip()
                         if kb_text is not None: keyboard_action_to_run["text"] = html.unescape(kb_text) # Unescape here
                         if kb_keys is not None: keyboard_action_to_run["keys"] = kb_keys.strip()
                         logger.info(f"Keyboard action parsed: {keyboard_action_to_run}"); action_parsed = True
-                    elif gui_match:
+                    elif action_kind == "gui_action":
                         try:
-                            gui_call, gui_args_json_html = gui_match.groups(); gui_args_json = html.unescape(gui_args_json_html.strip()); gui_args_dict = json.loads(gui_args_json)
+                            gui_call, gui_args_json_html = action_match.group("gui_call", "gui_args"); gui_args_json = html.unescape(gui_args_json_html.strip()); gui_args_dict = _json_loads(gui_args_json)
                             gui_action_to_run = {"call": gui_call.strip(), "args": gui_args_dict}; logger.info(f"GUI action parsed: {gui_action_to_run['call']}"); action_parsed = True
                         except Exception as gui_parse_err: logger.error(f"Error parsing GUI action JSON arguments: {gui_parse_err}"); self._try_emit_cli_error(f"Error parsing GUI action args: {gui_parse_err}")
-                    elif get_ui_info_match:
-                         params_str = get_ui_info_match.group(1)
+                    elif action_kind == "get_ui_info":
+                         params_str = action_match.group("ui_params")
                          get_ui_request = {"params": params_str}
                          logger.info(f"Get UI Info action parsed. Params: '{params_str}'"); action_parsed = True
                     else:
@@ -404,7 +608,7 @@ class ApiWorkerThread(QThread):
             if command_to_run:
                 logger.info(f"Executing command: '{command_to_run}'...")
                 self._try_emit_ai_command_echo(command_to_run) # Echo command to chat
-                status_message = f"Model {self._cwd}> {command_to_run}"; self._try_emit_cli_output_bytes(status_message.encode('utf-8')) # Echo to CLI
+                self._try_emit_cli_output_bytes(_MODEL_ECHO_PREFIX + f"{self._cwd}> {command_to_run}".encode('utf-8')) # Echo to CLI
                 try:
                     new_cwd, exit_code = execute_command_streamed( command=command_to_run, cwd=self._cwd, stop_flag_func=lambda: not self._is_running, output_signal=self.cli_output_signal, error_signal=self.cli_error_signal, directory_changed_signal=self.directory_changed_signal, is_manual_command=False)
                     self._cwd = new_cwd
@@ -421,18 +625,19 @@ class ApiWorkerThread(QThread):
                 logger.info(f"Executing GUI action: {gui_action_to_run['call']}...")
                 if self._gui_available and self._gui_controller:
                     logger.debug("Waiting 1.0s before GUI action...")
-                    time.sleep(1.0)
+                    self._pause(1.0)
                     if not self._is_running: logger.info("Aborted after delay, before GUI action execution."); return
                     if self._gui_controller and self._gui_controller.is_available(): # Re-check
                         try:
                             call_name = gui_action_to_run.get('call', 'Unknown'); args = gui_action_to_run.get('args', {}); timeout = args.get('wait_timeout', 5)
                             success, result_value = False, None
-                            gui_method = getattr(self._gui_controller, call_name, None)
-                            if callable(gui_method):
+                            returns_value = _GUI_DISPATCH.get(call_name) # None: not an action the model may call
+                            gui_method = getattr(self._gui_controller, call_name, None) if returns_value is not None else None
+                            if returns_value is None: self._try_emit_cli_error(f"Unsupported GUI action call: '{call_name}'"); logger.error(f"Unsupported GUI action call: '{call_name}'")
+                            elif callable(gui_method):
                                  logger.debug(f"Calling GuiController method '{call_name}' with timeout {timeout}s.")
-                                 if call_name in ['click_control', 'set_text', 'select_item', 'toggle_checkbox']: success = gui_method(args, timeout)
-                                 elif call_name in ['get_text', 'get_control_state']: result_value = gui_method(args, timeout); success = result_value is not None
-                                 else: self._try_emit_cli_error(f"Unsupported GUI action call: '{call_name}'"); logger.error(f"Unsupported GUI action call: '{call_name}'")
+                                 if returns_value: result_value = gui_method(args, timeout); success = result_value is not None
+                                 else: success = gui_method(args, timeout)
                             else:
                                 self._try_emit_cli_error(f"Unknown GUI action call in GuiController: '{call_name}'"); logger.error(f"Unknown GUI action call in GuiController: '{call_name}'")
                             # Log results/failures
@@ -447,9 +652,9 @@ class ApiWorkerThread(QThread):
                  logger.info("Executing Get UI Info action (Single Step)...")
                  params_str = get_ui_request.get("params", ""); format_type = "text"; max_depth = 3
                  try:
-                     fmt_match = re.search(r"format=['\"]([^'\"]+)['\"]", params_str, re.IGNORECASE); dep_match = re.search(r"max_depth=['\"](\d+)['\"]", params_str, re.IGNORECASE)
-                     if fmt_match: format_type = fmt_match.group(1).lower()
-                     if dep_match: max_depth = int(dep_match.group(1))
+                     ui_params = {key.lower(): value for key, value in _UI_PARAM_RE.findall(params_str)}
+                     if "format" in ui_params: format_type = ui_params["format"].lower()
+                     if "max_depth" in ui_params: max_depth = int(ui_params["max_depth"])
                  except Exception as param_parse_err: logger.warning(f"Could not parse get_ui_info params '{params_str}': {param_parse_err}")
                  logger.info(f"Getting UI info (Format: {format_type}, Depth: {max_depth})")
                  ui_text_info = get_active_window_ui_text(format_type, max_depth)
@@ -497,23 +702,21 @@ class ApiWorkerThread(QThread):
 
             # --- Process Reply ---
             reply_for_display, reply_for_parsing = raw_model_reply or "", raw_model_reply or ""
-            try:
-                logger.debug(f"Iteration {current_iteration}: Cleaning <think> tags...")
-                temp_cleaned_reply = re.sub(r"<think>.*?</think>", "", reply_for_parsing, flags=re.DOTALL | re.IGNORECASE).strip()
-                reply_for_display, reply_for_parsing = temp_cleaned_reply, temp_cleaned_reply
-                # Also clean <continue /> tag
-                reply_for_display = reply_for_display.replace("<continue />", "").strip()
-                reply_for_parsing = reply_for_parsing.replace("<continue />", "").strip()
-                logger.debug(f"Iteration {current_iteration}: Reply after <think>/<continue> cleaning: {reply_for_display[:200]}...")
-            except Exception as clean_err: logger.warning(f"Iteration {current_iteration}: Error cleaning tags.", exc_info=True)
+            skip_parse = not reply_for_parsing or reply_for_parsing.startswith("错误:") # Empty or error reply: nothing to clean or parse
+            if not skip_parse:
+                try:
+                    logger.debug(f"Iteration {current_iteration}: Cleaning <think> tags...")
+                    temp_cleaned_reply = _strip_think(reply_for_parsing).strip()
+                    reply_for_display, reply_for_parsing = temp_cleaned_reply, temp_cleaned_reply
+                    # Also clean <continue /> tag
+                    reply_for_display = reply_for_display.replace("<continue />", "").strip()
+                    reply_for_parsing = reply_for_parsing.replace("<continue />", "").strip()
+                    logger.debug(f"Iteration {current_iteration}: Reply after <think>/<continue> cleaning: {reply_for_display[:200]}...")
+                except Exception as clean_err: logger.warning(f"Iteration {current_iteration}: Error cleaning tags.", exc_info=True)
 
             # --- Emit Text Result to UI (if changed or error) ---
             logger.debug(f"Iteration {current_iteration}: Cleaning action tags for UI display...")
-            display_text_for_emit = reply_for_display
-            actions_to_clean = [r"<cmd>.*?</cmd>", r"<gui_action\s+call=.*?/>", r"<keyboard\s+call=.*?/>", r"<get_ui_info\s*.*?/>"]
-            for pattern in actions_to_clean:
-                try: display_text_for_emit = re.sub(pattern, "", display_text_for_emit, flags=re.DOTALL | re.IGNORECASE).strip()
-                except Exception as action_clean_err: logger.warning(f"Iteration {current_iteration}: Error cleaning pattern '{pattern}': {action_clean_err}")
+            display_text_for_emit = reply_for_display if skip_parse else _strip_action_tags(reply_for_display, False) # <continue /> was removed above
             display_text_to_emit = display_text_for_emit if display_text_for_emit else raw_model_reply
             if "错误:" in raw_model_reply and "错误:" not in display_text_to_emit: display_text_to_emit = raw_model_reply
             logger.debug(f"Iteration {current_iteration}: Text to emit to UI: {display_text_to_emit[:200]}...")
@@ -529,32 +732,30 @@ class ApiWorkerThread(QThread):
             command_to_run, keyboard_action_to_run, gui_action_to_run, get_ui_request = None, None, None, None
             exit_code = None # Store command exit code
 
-            if reply_for_parsing and isinstance(reply_for_parsing, str) and "错误:" not in raw_model_reply:
+            if not skip_parse and reply_for_parsing and "错误:" not in raw_model_reply:
                 logger.info(f"Iteration {current_iteration}: Parsing reply for actions...")
                 try:
                     # --- Action Parsing Logic (Same as single step) ---
-                    command_match = re.search(r"<cmd>\s*(.*?)\s*</cmd>", reply_for_parsing, re.DOTALL | re.IGNORECASE)
-                    keyboard_match = re.search(r"""<keyboard\s+call=['"]([^'"]+)['"]\s+(?:key=['"]([^'"]+)['"]|text=['"](.*?)['"]|keys=['"]([^'"]+)['"])\s*/>""", reply_for_parsing, re.VERBOSE | re.DOTALL | re.IGNORECASE)
-                    gui_match = re.search(r"""<gui_action\s+call=['"]([^'"]+)['"]\s+args=['"](.*?)['"]\s*/>""", reply_for_parsing, re.VERBOSE | re.DOTALL | re.IGNORECASE)
-                    get_ui_info_match = re.search(r"<get_ui_info\s*(.*?)\s*/>", reply_for_parsing, re.IGNORECASE)
+                    action_match = _find_action(reply_for_parsing)
+                    action_kind = action_match.lastgroup if action_match else None
 
-                    if command_match:
-                        command_to_run = command_match.group(1).strip() or None
+                    if action_kind == "cmd":
+                        command_to_run = action_match.group("cmd_body").strip() or None
                         if command_to_run: logger.info(f"Iteration {current_iteration}: Command action parsed: '{command_to_run}'"); action_found_this_iteration = True
-                    elif keyboard_match:
-                        kb_call = keyboard_match.group(1).strip().lower(); kb_key = keyboard_match.group(2); kb_text = keyboard_match.group(3); kb_keys = keyboard_match.group(4)
+                    elif action_kind == "keyboard":
+                        kb_call, kb_key, kb_text, kb_keys = action_match.group("kb_call", "kb_key", "kb_text", "kb_keys"); kb_call = kb_call.strip().lower()
                         keyboard_action_to_run = {"call": kb_call}
                         if kb_key is not None: keyboard_action_to_run["key"] = kb_key.strip()
                         if kb_text is not None: keyboard_action_to_run["text"] = html.unescape(kb_text)
                         if kb_keys is not None: keyboard_action_to_run["keys"] = kb_keys.strip()
                         logger.info(f"Iteration {current_iteration}: Keyboard action parsed: {keyboard_action_to_run}"); action_found_this_iteration = True
-                    elif gui_match:
+                    elif action_kind == "gui_action":
                         try:
-                            gui_call, gui_args_json_html = gui_match.groups(); gui_args_json = html.unescape(gui_args_json_html.strip()); gui_args_dict = json.loads(gui_args_json)
+                            gui_call, gui_args_json_html = action_match.group("gui_call", "gui_args"); gui_args_json = html.unescape(gui_args_json_html.strip()); gui_args_dict = _json_loads(gui_args_json)
                             gui_action_to_run = {"call": gui_call.strip(), "args": gui_args_dict}; logger.info(f"Iteration {current_iteration}: GUI action parsed: {gui_action_to_run['call']}"); action_found_this_iteration = True
                         except Exception as gui_parse_err: logger.error(f"Iteration {current_iteration}: Error parsing GUI action JSON arguments: {gui_parse_err}"); self._try_emit_cli_error(f"Error parsing GUI action args: {gui_parse_err}")
-                    elif get_ui_info_match:
-                         params_str = get_ui_info_match.group(1)
+                    elif action_kind == "get_ui_info":
+                         params_str = action_match.group("ui_params")
                          get_ui_request = {"params": params_str}
                          logger.info(f"Iteration {current_iteration}: Get UI Info action parsed. Params: '{params_str}'"); action_found_this_iteration = True
                     else: logger.info(f"Iteration {current_iteration}: No executable action tag found in reply.")
@@ -571,7 +772,7 @@ class ApiWorkerThread(QThread):
                 action_executed = True
                 logger.info(f"Iteration {current_iteration}: Executing command: '{command_to_run}'...")
                 self._try_emit_ai_command_echo(command_to_run)
-                status_message = f"Model {self._cwd}> {command_to_run}"; self._try_emit_cli_output_bytes(status_message.encode('utf-8'))
+                self._try_emit_cli_output_bytes(_MODEL_ECHO_PREFIX + f"{self._cwd}> {command_to_run}".encode('utf-8'))
                 try:
                     original_cwd = self._cwd
                     new_cwd, exit_code = execute_command_streamed( command=command_to_run, cwd=self._cwd, stop_flag_func=lambda: not self._is_running, output_signal=self.cli_output_signal, error_signal=self.cli_error_signal, directory_changed_signal=self.directory_changed_signal, is_manual_command=False )
@@ -585,7 +786,7 @@ class ApiWorkerThread(QThread):
                     else: outcome += f" Failed (Exit Code: {exit_code})."
                     if original_cwd != self._cwd: outcome += f" CWD changed to '{self._cwd}'."
                     self._action_outcome_message = outcome
-                    time.sleep(0.5 if self._is_running else 0)
+                    self._pause(0.5)
                 except Exception as exec_err: logger.error(f"Iteration {current_iteration}: Error executing command.", exc_info=True); self._action_outcome_message = f"System Error: Failed command '{command_to_run[:50]}...': {exec_err}"; self._try_emit_cli_error(self._action_outcome_message)
                 if not self._is_running: break # Break if stopped by user
 
@@ -596,7 +797,7 @@ class ApiWorkerThread(QThread):
                 self._action_outcome_message = outcome_msg
                 if not success: self._try_emit_cli_error(outcome_msg)
                 logger.info(f"Iteration {current_iteration}: Keyboard action finished. Success: {success}, Message: {outcome_msg}")
-                time.sleep(0.5 if self._is_running else 0)
+                self._pause(0.5)
 
             elif gui_action_to_run:
                 action_executed = True
@@ -604,18 +805,19 @@ class ApiWorkerThread(QThread):
                 action_success, action_error_message, action_result_value = False, "", None
                 if self._gui_available and self._gui_controller:
                     logger.debug(f"Iteration {current_iteration}: Waiting 1.0s before GUI action...")
-                    time.sleep(1.0)
+                    self._pause(1.0)
                     if not self._is_running: logger.info(f"Iteration {current_iteration}: Aborted after delay, before GUI action execution."); break
                     if self._gui_controller and self._gui_controller.is_available():
                         try:
                             call_name = gui_action_to_run.get('call', 'Unknown'); args = gui_action_to_run.get('args', {}); timeout = args.get('wait_timeout', 5)
                             locators = {k: args.get(k) for k in ['name', 'automation_id', 'control_type', 'class_name', 'parent_name', 'parent_automation_id', 'parent_control_type']}
-                            gui_method = getattr(self._gui_controller, call_name, None)
-                            if callable(gui_method):
+                            returns_value = _GUI_DISPATCH.get(call_name) # None: not an action the model may call
+                            gui_method = getattr(self._gui_controller, call_name, None) if returns_value is not None else None
+                            if returns_value is None: action_error_message = f"Unsupported GUI action call: '{call_name}'"; self._try_emit_cli_error(action_error_message); logger.error(f"Unsupported GUI action call: '{call_name}'")
+                            elif callable(gui_method):
                                 logger.debug(f"Iteration {current_iteration}: Calling GuiController method '{call_name}' with timeout {timeout}s.")
-                                if call_name in ['click_control', 'set_text', 'select_item', 'toggle_checkbox']: action_success = gui_method(args, timeout)
-                                elif call_name in ['get_text', 'get_control_state']: action_result_value = gui_method(args, timeout); action_success = action_result_value is not None
-                                else: action_error_message = f"Unsupported GUI action call: '{call_name}'"; self._try_emit_cli_error(action_error_message); logger.error(f"Unsupported GUI action call: '{call_name}'")
+                                if returns_value: action_result_value = gui_method(args, timeout); action_success = action_result_value is not None
+                                else: action_success = gui_method(args, timeout)
                             else: action_error_message = f"Unknown GUI action call in GuiController: '{call_name}'"; self._try_emit_cli_error(action_error_message); logger.error(f"Unknown GUI action call in GuiController: '{call_name}'")
                             if not action_success and not action_error_message: action_error_message = f"GUI Action '{call_name}' failed (no specific error reported)."
                         except Exception as gui_exec_err: logger.error(f"Iteration {current_iteration}: Error executing GUI action '{gui_action_to_run.get('call')}'", exc_info=True); action_error_message = f"GUI action execution error: {gui_exec_err}"; self._try_emit_cli_error(action_error_message); action_success = False
@@ -627,16 +829,16 @@ class ApiWorkerThread(QThread):
                 else: outcome = f"GUI Action '{gui_call_summary}' on control matching {locators_summary} failed."; outcome += f" Reason: {action_error_message}" if action_error_message else ""
                 self._action_outcome_message = outcome
                 logger.info(f"Iteration {current_iteration}: GUI action finished. Success: {action_success}. Outcome: {outcome}")
-                time.sleep(0.5 if self._is_running else 0)
+                self._pause(0.5)
 
             elif get_ui_request:
                 action_executed = True
                 logger.info(f"Iteration {current_iteration}: Executing Get UI Info action...")
                 params_str = get_ui_request.get("params", ""); format_type = "text"; max_depth = 3
                 try:
-                     fmt_match = re.search(r"format=['\"]([^'\"]+)['\"]", params_str, re.IGNORECASE); dep_match = re.search(r"max_depth=['\"](\d+)['\"]", params_str, re.IGNORECASE)
-                     if fmt_match: format_type = fmt_match.group(1).lower()
-                     if dep_match: max_depth = int(dep_match.group(1))
+                     ui_params = {key.lower(): value for key, value in _UI_PARAM_RE.findall(params_str)}
+                     if "format" in ui_params: format_type = ui_params["format"].lower()
+                     if "max_depth" in ui_params: max_depth = int(ui_params["max_depth"])
                 except Exception as param_parse_err: logger.warning(f"Could not parse get_ui_info params '{params_str}': {param_parse_err}")
                 logger.info(f"Iteration {current_iteration}: Getting UI info (Format: {format_type}, Depth: {max_depth})")
                 ui_text_info = get_active_window_ui_text(format_type, max_depth)
@@ -645,7 +847,7 @@ class ApiWorkerThread(QThread):
                     self._action_outcome_message = f"当前活动窗口 UI 信息 ({format_type}, 深度 {max_depth}):\n{info_to_store}"
                     logger.info(f"Iteration {current_iteration}: Get UI Info succeeded. Stored outcome length: {len(self._action_outcome_message)}")
                 else: self._action_outcome_message = "系统: 无法获取当前活动窗口的 UI 信息。"; logger.warning(f"Iteration {current_iteration}: Get UI Info failed.")
-                time.sleep(0.2)
+                self._pause(0.2)
 
             # --- Update History and Check Loop Conditions ---
             if not action_executed:
@@ -667,7 +869,7 @@ class ApiWorkerThread(QThread):
                 break
             # Small pause before next iteration
             logger.debug(f"Iteration {current_iteration}: Pausing briefly before next iteration.")
-            time.sleep(0.2)
+            self._pause(0.2)
             logger.info(f"--- Multi-Step Iteration {current_iteration}/{max_iterations} End ---")
 
 
@@ -717,7 +919,7 @@ class ApiWorkerThread(QThread):
                 for key_name in keys:
                     key_code = KEY_MAPPING.get(key_name)
                     if key_code is None: raise ValueError(f"Unknown key name in hotkey: '{key_name}'")
-                    if key_name in ['ctrl', 'control', 'alt', 'menu', 'shift', 'win', 'windows']: modifiers_to_press.append(key_code)
+                    if key_name in _MODIFIER_KEY_NAMES: modifiers_to_press.append(key_code)
                     elif main_key_code is None: main_key_code = key_code
                     else: raise ValueError(f"Hotkey can only have one non-modifier key. Found multiple: '{keys_str}'")
                 if main_key_code is None: raise ValueError(f"No non-modifier key found in hotkey: '{keys_str}'")
@@ -737,6 +939,13 @@ class ApiWorkerThread(QThread):
         return success, outcome_message
 
     # --- Signal Emission Helpers (Added Logging) ---
+    def _try_emit_api_partial_result(self, partial_reply: str):
+        """Safely emit the api_partial_result signal."""
+        if self._is_running:
+            try: self.api_partial_result.emit(partial_reply)
+            except RuntimeError: logger.warning("Cannot emit api_partial_result signal, target likely deleted.")
+            except Exception as e: logger.error("Error emitting api_partial_result signal.", exc_info=True)
+
     def _try_emit_api_result(self, message: str, elapsed_time: float):
         """Safely emit the api_result signal."""
         if self._is_running:
@@ -771,15 +980,14 @@ class ApiWorkerThread(QThread):
         """Helper to format and emit error messages."""
         try:
             if not isinstance(message, str): message = str(message)
-            error_prefix = "[Error] "
+            error_prefix = b"[Error] "
             msg_lower = message.lower()
-            if "keyboard" in msg_lower or "key name" in msg_lower or "hotkey" in msg_lower: error_prefix = "[Keyboard Error] "
-            elif "gui" in msg_lower or "uiautomation" in msg_lower or "control" in msg_lower: error_prefix = "[GUI Ctrl Error] "
-            elif "command" in msg_lower or "shell" in msg_lower or "exit code" in msg_lower: error_prefix = "[Shell Error] "
-            elif "api" in msg_lower or "request" in msg_lower or "model" in msg_lower: error_prefix = "[API Error] "
-            full_message = f"{error_prefix}{message}"
-            logger.debug(f"Emitting cli_error signal: {full_message}")
-            self.cli_error_signal.emit(full_message.encode('utf-8'))
+            if "keyboard" in msg_lower or "key name" in msg_lower or "hotkey" in msg_lower: error_prefix = b"[Keyboard Error] "
+            elif "gui" in msg_lower or "uiautomation" in msg_lower or "control" in msg_lower: error_prefix = b"[GUI Ctrl Error] "
+            elif "command" in msg_lower or "shell" in msg_lower or "exit code" in msg_lower: error_prefix = b"[Shell Error] "
+            elif "api" in msg_lower or "request" in msg_lower or "model" in msg_lower: error_prefix = b"[API Error] "
+            logger.debug(f"Emitting cli_error signal: {error_prefix.decode('ascii')}{message}")
+            self.cli_error_signal.emit(error_prefix + message.encode('utf-8'))
         except RuntimeError: logger.warning("Cannot emit cli_error signal, target likely deleted.")
         except Exception as e: logger.error("Unexpected error emitting CLI error signal.", exc_info=True)
 
@@ -794,6 +1002,19 @@ class ApiWorkerThread(QThread):
         except Exception as e: logger.error(f"Unexpected error emitting {signal_name}.", exc_info=True)
 
 
+    def _get_system_message(self, is_multi_step_flow: bool, include_timestamp: bool, max_iterations: int) -> Tuple[Dict[str, str], bytes]:
+        """Returns the system prompt message and its JSON. Only the timestamp is filled in per call while CWD and mode are unchanged."""
+        cache_key = (self._cwd, is_multi_step_flow, max_iterations)
+        if cache_key != self._system_message_cache_key or self._system_message_cache is None:
+            flow_instructions = _MULTI_STEP_FLOW_TEMPLATE.format(max_iterations=max_iterations) if is_multi_step_flow else _SINGLE_STEP_FLOW_INSTRUCTIONS
+            head, tail = _SYSTEM_PROMPT_HEAD_TEMPLATE.format(cwd=self._cwd), _SYSTEM_PROMPT_TAIL + flow_instructions
+            # JSON string escaping works per character, so the two serialized halves can be joined around the timestamp
+            self._system_message_cache_key = cache_key; self._system_message_cache = (head, tail, _json_dumps(head)[:-1], _json_dumps(tail)[1:])
+        head, tail, head_json, tail_json = self._system_message_cache
+        timestamp_info = f"{_TIMESTAMP_PREFIX}{datetime.datetime.now().isoformat(sep=' ', timespec='seconds')}. " if include_timestamp else "" # ASCII, needs no JSON escaping
+        system_msg = {"role": "system", "content": head + timestamp_info + tail}
+        return system_msg, b"".join((_SYSTEM_MESSAGE_JSON_PREFIX, head_json, timestamp_info.encode('ascii'), tail_json, b"}"))
+
     def _send_message_to_model(self, is_multi_step_flow: bool):
         """Sends history and prompt to the configured AI model API, potentially including UI info. Logs the process."""
         logger.info("Preparing to send message to model...")
@@ -815,57 +1036,23 @@ class ApiWorkerThread(QThread):
         url = f"{api_url.rstrip('/')}/v1/chat/completions" # Assume OpenAI compatible API endpoint
         logger.debug(f"Target API URL: {url}")
 
-        os_name = platform.system(); shell_type = "PowerShell" if os_name == "Windows" else "Default Shell"
-        shell_info = f"You are operating within {shell_type} on {os_name}."
-        timestamp_info = f"Current date and time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}. " if include_timestamp else ""
-
         # --- Construct System Prompt ---
-        # (System prompt content remains the same, no logging needed inside the string itself)
-        base_instructions = (
-            f"You are an AI assistant interacting with a user's computer ({os_name}). "
-            f"{shell_info} Your goal is to fulfill user requests by executing actions. "
-            f"Prioritize actions in this order: 1. `<cmd>` (Shell Command), 2. `<keyboard>` (Keyboard Simulation - Windows ONLY), 3. `<gui_action>` (GUI Control - Windows ONLY).\n"
-            f"Current Working Directory (CWD): '{self._cwd}'\n"
-            f"{timestamp_info}"
-            f"**ACTION RULES:**\n" # ... (rest of rules) ...
-            f"**UI 信息 (Windows ONLY, 可选):**\n" # ... (UI info explanation) ...
-            f"**General Instructions:**\n" # ... (general instructions) ...
-        )
-        flow_instructions = ""
-        if is_multi_step_flow:
-            flow_instructions = f"""
-
-**Iterative Operation Mode:**
-- You are in a multi-step process. Your previous action's outcome (or UI info) is in the history (System message).
-- Max consecutive actions: {max_iterations}.
-- **Your Task:** Analyze history/outcome/UI info. Determine the **single next action** (`<cmd>`, `<keyboard>`, `<gui_action>`, or `<get_ui_info>`).
-- If task complete, provide final **textual confirmation/summary** (in Chinese) with NO action tags.
-- If error occurred, try to correct or inform user.
-- **Remember:** Only provide the *next single step* or the *final textual response*.
-**请根据上一步操作的结果/UI信息决定下一步操作 (`<cmd>`, `<keyboard>`, `<gui_action>`, `<get_ui_info>`) 或提供最终的中文文本回复。**
-"""
-        else:
-             flow_instructions = """
-
-**Single Operation Mode:**
-- Analyze user request and potentially provided UI info. Provide the single best action (`<cmd>`, `<keyboard>`, `<gui_action>`, `<get_ui_info>`) OR a textual response.
-- No follow-up API call after action execution.
-"""
-        system_message = base_instructions + flow_instructions
-        messages = [{"role": "system", "content": system_message}]
+        system_msg, system_msg_json = self._get_system_message(is_multi_step_flow, include_timestamp, max_iterations)
+        system_message = system_msg["content"]
         logger.debug(f"System prompt constructed (Length: {len(system_message)}). Multi-step flow: {is_multi_step_flow}")
 
         # --- Process history for API payload ---
-        logger.debug(f"Processing history (Size: {len(self._history)}) for API payload...")
-        history_msg_count = 0
-        for role, message in self._history:
-            cleaned_message = message if isinstance(message, str) else str(message)
-            cleaned_message = re.sub(r"<think>.*?</think>", "", cleaned_message, flags=re.DOTALL | re.IGNORECASE).strip()
-            if not cleaned_message: logger.debug("Skipping empty message in history."); continue
-            api_role = "user" if role.lower() == "user" else "assistant" if role.lower() == "assistant" else "system"
-            messages.append({"role": api_role, "content": cleaned_message})
-            history_msg_count += 1
-        logger.debug(f"Added {history_msg_count} messages from history.")
+        # History is append-only, so entries cleaned for an earlier iteration are reused; only new ones are scrubbed.
+        logger.debug(f"Processing history (Size: {len(self._history)}, already cleaned: {self._history_messages_count}) for API payload...")
+        if len(self._history) > self._history_messages_count:
+            for role, message in self._history[self._history_messages_count:]:
+                prepared = _prepare_history_message(role, message if isinstance(message, str) else str(message))
+                if prepared is None: continue # Empty messages are skipped
+                self._history_messages.append(prepared[0]); self._history_messages_json.append(prepared[1])
+            self._history_messages_count = len(self._history)
+        messages = [system_msg, *self._history_messages]
+        message_fragments = [system_msg_json, *self._history_messages_json] # Serialized messages, spliced into the request body
+        logger.debug(f"Added {len(messages) - 1} messages from history.")
 
         # --- Add UI Info if configured and available ---
         if auto_include_ui and self._gui_available:
@@ -876,65 +1063,73 @@ class ApiWorkerThread(QThread):
                 if ui_info_text:
                      max_len = 2500; ui_info_to_add = ui_info_text[:max_len] + (f"\n... [UI 信息已截断, 超过 {max_len} 字符]" if len(ui_info_text) > max_len else "")
                      ui_message = {"role": "system", "content": f"当前活动窗口 UI 结构 (参考):\n{ui_info_to_add}"}
-                     messages.append(ui_message) # Append UI info near the end
+                     messages.append(ui_message); message_fragments.append(_json_dumps(ui_message)) # Append UI info near the end
                      logger.info(f"Added automatically retrieved UI info (length {len(ui_info_to_add)}) to messages.")
                 else: logger.warning("get_active_window_ui_text returned no information for automatic inclusion.")
             except Exception as ui_get_err:
                  logger.error("Error getting UI info for automatic inclusion.", exc_info=True)
                  # Optionally add an error message to the context
-                 messages.append({"role": "system", "content": f"系统错误: 自动获取 UI 信息失败: {ui_get_err}"})
+                 ui_error_message = {"role": "system", "content": f"系统错误: 自动获取 UI 信息失败: {ui_get_err}"}
+                 messages.append(ui_error_message); message_fragments.append(_json_dumps(ui_error_message))
         elif auto_include_ui and not self._gui_available:
              logger.warning("Auto-include UI info is enabled, but GUI is not available.")
 
-        # --- Prepare API Call ---
-        session = requests.Session()
-        if URLLIB3_RETRY_AVAILABLE:
-            try:
-                retry_strategy = Retry( total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["POST"])
-                adapter = HTTPAdapter(max_retries=retry_strategy)
-                session.mount("https://", adapter); session.mount("http://", adapter)
-                logger.debug("Requests session configured with retry strategy.")
-            except Exception as e: logger.warning(f"Could not configure requests retries: {e}")
-        else: logger.debug("Requests retries not available or disabled.")
-
         # --- Make API call ---
         reply_text = "错误: API 调用失败或未产生响应。" # Default error
         try:
-            payload = { "model": self._model_id, "messages": messages, "max_tokens": 1500, "temperature": 0.5 }
-            payload_size = 0
-            try: payload_size = len(json.dumps(payload)) # Estimate size
-            except: pass
+            payload = { "model": self._model_id, "max_tokens": 1500, "temperature": 0.5, "stream": True }
+            # Only the small header object is serialized here; the messages array is joined from cached JSON fragments
+            request_body = b"".join((_json_dumps(payload)[:-1], b',"messages":[', b",".join(message_fragments), b"]}"))
+            payload_size = len(request_body)
             logger.info(f"Sending API request to {url} (Model: {self._model_id}, Msgs: {len(messages)}, Approx Size: {payload_size} bytes)")
             # logger.debug(f"API Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}") # Log full payload only if needed for deep debug
 
             timeout_seconds = 90 # Increased timeout
-            response = session.post(url, headers=headers, json=payload, timeout=timeout_seconds)
-            logger.info(f"API Response Status Code: {response.status_code}")
+            # stream=True: tokens arrive as server-sent events and are parsed while the body is still downloading
+            with _API_SESSION.post(url, headers=headers, data=request_body, timeout=timeout_seconds, stream=True) as response:
+                logger.info(f"API Response Status Code: {response.status_code}")
 
-            response.encoding = 'utf-8'
-            if response.ok:
-                try:
-                    data = response.json()
-                    logger.debug(f"API Response JSON (Top Level Keys): {list(data.keys()) if isinstance(data, dict) else type(data)}")
-                    # (Response parsing logic remains the same)
-                    if 'choices' in data and data['choices']:
-                         choice = data['choices'][0]; finish_reason = choice.get('finish_reason', 'N/A')
-                         content = ""; msg_data = choice.get('message')
-                         if msg_data and isinstance(msg_data, dict) and 'content' in msg_data: content = msg_data['content']
-                         elif 'text' in choice: content = choice['text'] # Fallback
-                         reply_text = content if content is not None else ""
-                         logger.info(f"API call successful. Finish reason: {finish_reason}")
-                         if finish_reason == 'length': reply_text += "\n[警告: AI 输出可能因达到最大长度而被截断。]"; logger.warning("AI output may be truncated due to max length.")
-                    elif 'error' in data: error_obj = data.get('error', data); reply_text = f"来自 API 的错误: {error_obj.get('message', json.dumps(error_obj))}"; logger.error(f"API returned error: {reply_text}")
-                    else: reply_text = "错误: 意外的 API 响应结构。"; logger.error(f"Unexpected API response structure: {data}")
-                except json.JSONDecodeError as json_err: reply_text = f"错误: 无法解码 API 响应 JSON (状态码 {response.status_code})"; logger.error(f"API JSON Decode Error: {json_err}", exc_info=True)
-                except Exception as parse_err: reply_text = f"错误: 解析成功的 API 响应时出错: {parse_err}"; logger.error("Error parsing successful API response.", exc_info=True)
-            else:
-                err_details = ""
-                try: err_data = response.json(); error_obj = err_data.get('error', err_data); err_details = str(error_obj.get('message', error_obj));
-                except: err_details = response.text[:200]
-                reply_text = f"错误: API 请求失败 (状态码 {response.status_code}) 详情: {err_details}"
-                logger.error(f"API request failed: {reply_text}")
+                response.encoding = 'utf-8'
+                if response.ok:
+                    try:
+                        content_type = response.headers.get('Content-Type', '')
+                        if 'text/event-stream' in content_type:
+                            logger.debug("Reading streamed (SSE) API response...")
+                            content, finish_reason, stream_error = self._read_event_stream(response)
+                            if not self._is_running: reply_text = "错误: API 调用已取消。"; logger.warning("Stop signal received while streaming. Response abandoned.")
+                            elif stream_error is not None: reply_text = f"来自 API 的错误: {stream_error}"; logger.error(f"API returned error in stream: {reply_text}")
+                            else:
+                                reply_text = content
+                                logger.info(f"API call successful (streamed). Finish reason: {finish_reason or 'N/A'}")
+                                if finish_reason == 'length': reply_text += "\n[警告: AI 输出可能因达到最大长度而被截断。]"; logger.warning("AI output may be truncated due to max length.")
+                        else:
+                            # Endpoint ignored "stream": fall back to a regular JSON body
+                            body = bytearray()
+                            for chunk in response.iter_content(chunk_size=65536): # Checked per chunk so a stop request drops the download
+                                if not self._is_running: break
+                                body += chunk
+                            if not self._is_running: logger.warning("Stop signal received while downloading API response."); return "错误: API 调用已取消。"
+                            data = _json_loads(body)
+                            logger.debug(f"API Response JSON (Top Level Keys): {list(data.keys()) if isinstance(data, dict) else type(data)}")
+                            # (Response parsing logic remains the same)
+                            if 'choices' in data and data['choices']:
+                                 choice = data['choices'][0]; finish_reason = choice.get('finish_reason', 'N/A')
+                                 content = ""; msg_data = choice.get('message')
+                                 if msg_data and isinstance(msg_data, dict) and 'content' in msg_data: content = msg_data['content']
+                                 elif 'text' in choice: content = choice['text'] # Fallback
+                                 reply_text = content if content is not None else ""
+                                 logger.info(f"API call successful. Finish reason: {finish_reason}")
+                                 if finish_reason == 'length': reply_text += "\n[警告: AI 输出可能因达到最大长度而被截断。]"; logger.warning("AI output may be truncated due to max length.")
+                            elif 'error' in data: error_obj = data.get('error', data); reply_text = f"来自 API 的错误: {error_obj.get('message', json.dumps(error_obj))}"; logger.error(f"API returned error: {reply_text}")
+                            else: reply_text = "错误: 意外的 API 响应结构。"; logger.error(f"Unexpected API response structure: {data}")
+                    except json.JSONDecodeError as json_err: reply_text = f"错误: 无法解码 API 响应 JSON (状态码 {response.status_code})"; logger.error(f"API JSON Decode Error: {json_err}", exc_info=True)
+                    except Exception as parse_err: reply_text = f"错误: 解析成功的 API 响应时出错: {parse_err}"; logger.error("Error parsing successful API response.", exc_info=True)
+                else:
+                    err_details = ""
+                    try: err_data = _json_loads(response.content); error_obj = err_data.get('error', err_data); err_details = str(error_obj.get('message', error_obj));
+                    except: err_details = response.text[:200]
+                    reply_text = f"错误: API 请求失败 (状态码 {response.status_code}) 详情: {err_details}"
+                    logger.error(f"API request failed: {reply_text}")
 
             if not isinstance(reply_text, str): reply_text = str(reply_text)
             return reply_text.strip()
@@ -943,9 +1138,40 @@ class ApiWorkerThread(QThread):
         except requests.exceptions.SSLError as e: logger.error(f"API request SSL Error: {e}", exc_info=False); return f"错误: SSL 验证失败 ({e})。"
         except requests.exceptions.RequestException as e: status_code = getattr(getattr(e, 'response', None), 'status_code', 'N/A'); logger.error(f"API request Network/Connection Error (Status: {status_code}): {e}", exc_info=False); return f"错误: API 请求失败 (网络/连接错误, 状态码: {status_code})"
         except Exception as e: logger.critical("Unhandled Exception in _send_message_to_model", exc_info=True); return f"错误: API 调用期间发生意外错误 ({type(e).__name__})"
-        finally:
-            session.close() # Ensure session is closed
-            logger.debug("Requests session closed.")
+
+    def _read_event_stream(self, response) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Accumulates content deltas from an OpenAI-compatible server-sent-events response.
+        Returns:
+            tuple: (content, finish_reason, error_message) - error_message is None unless the stream reported an error.
+        """
+        parts: List[str] = []
+        finish_reason = None
+        last_emit, unsent_deltas = 0.0, 0 # The preview is re-rendered in full, so updates are batched instead of sent per token
+        for line in response.iter_lines():
+            if not self._is_running: logger.debug("SSE stream abandoned: stop signal set."); break # Closing the response drops the connection
+            # Skip keep-alive blank lines, SSE comments and non-data fields
+            if not line or not line.startswith(b"data:"): continue
+            data = line[5:].strip()
+            if data == b"[DONE]": break
+            frame = _json_loads(data)
+            if 'error' in frame:
+                error_obj = frame.get('error') or frame
+                return "".join(parts), finish_reason, str(error_obj.get('message', error_obj) if isinstance(error_obj, dict) else error_obj)
+            choices = frame.get('choices')
+            if not choices: continue
+            choice = choices[0]
+            delta = choice.get('delta') or {}
+            content = delta.get('content')
+            if content is None: content = choice.get('text') # Legacy completions-style frames
+            if content:
+                parts.append(content); unsent_deltas += 1
+                now = time.monotonic()
+                if unsent_deltas >= _PARTIAL_EMIT_DELTAS or now - last_emit >= _PARTIAL_EMIT_INTERVAL:
+                    self._try_emit_api_partial_result(_preview_text("".join(parts))); last_emit, unsent_deltas = now, 0
+            if choice.get('finish_reason'): finish_reason = choice['finish_reason']
+        logger.debug(f"SSE stream finished: {len(parts)} content delta(s) received.")
+        return "".join(parts), finish_reason, None
 
 # --- ManualCommandThread ---
 class ManualCommandThread(QThread):
@@ -967,6 +1193,7 @@ class ManualCommandThread(QThread):
     def stop(self):
         logger.info("ManualCommandThread stop() called. Setting internal flag.")
         self._is_running = False
+        wake_running_commands() # A command being streamed notices the flag at once instead of at its next select timeout
 
     def run(self):
         logger.info("ManualCommandThread run() started.")
@@ -1019,9 +1246,8 @@ class ManualCommandThread(QThread):
         if self._is_running:
             try:
                 if not isinstance(message, str): message = str(message)
-                full_message = f"错误: {message}"
-                logger.debug(f"Emitting cli_error signal (manual): {full_message}")
-                self.cli_error_signal.emit(full_message.encode('utf-8'))
+                logger.debug(f"Emitting cli_error signal (manual): 错误: {message}")
+                self.cli_error_signal.emit(_MANUAL_ERROR_PREFIX + message.encode('utf-8'))
             except RuntimeError: logger.warning("Cannot emit cli_error signal (manual), target likely deleted.")
             except Exception as e: logger.error("Error emitting CLI error signal (manual).", exc_info=True)
         else: logger.debug("Skipping CLI error signal emission (manual worker stopped).")
\ No newline at end of file
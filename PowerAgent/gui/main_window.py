@@ -99,6 +99,7 @@ class MainWindow(QMainWindow, HandlersMixin, UpdatesMixin, StateMixin, WorkersMi
         self.cli_history_index = -1
         self.api_worker_thread: ApiWorkerThread | None = None
         self.manual_cmd_thread: ManualCommandThread | None = None
+        self._stream_preview_start: int | None = None # Chat document position of the streaming reply preview
         self.settings_dialog_open = False
         self._closing = False
         logger.debug("State variables initialized.")
@@ -17,7 +17,7 @@ from PySide6.QtGui import QTextCursor, QTextCharFormat, QColor, QPalette, QIcon,
 # Import necessary components from the project
 from constants import APP_NAME, get_color
 from core import config # For theme, CWD, models
-from core.worker_utils import decode_output
+from core.worker_utils import decode_output_bytes
 from .stylesheets import STYLESHEET_TEMPLATE, MINIMAL_STYLESHEET_SYSTEM_THEME
 
 # Type hinting for MainWindow without causing circular import at runtime
@@ -331,6 +331,7 @@ class UpdatesMixin:
         # --- Update Display ---
         if self._closing: logger.debug("Skipping chat display update (closing)."); return
         if not self.chat_history_display: logger.error("Cannot add chat message: chat_history_display not found."); return
+        self.clear_streaming_reply_preview() # Any real message supersedes a live reply preview
 
         target_widget = self.chat_history_display
         role_display = "AI Command" if role_lower == "ai command" else role.capitalize()
@@ -440,6 +441,43 @@ class UpdatesMixin:
         logger.info("Finished adding chat message.")
 
 
+    def show_streaming_reply_preview(self: 'MainWindow', partial_reply: str):
+        """Shows the model reply received so far in a temporary block at the end of the chat display."""
+        if self._closing or not self.chat_history_display: return
+        try:
+            document = self.chat_history_display.document()
+            scrollbar = self.chat_history_display.verticalScrollBar(); at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+            cursor = QTextCursor(document) # Separate cursor: the user's selection is left alone
+            if self._stream_preview_start is None or self._stream_preview_start >= document.characterCount(): # New preview (or display was cleared)
+                cursor.movePosition(QTextCursor.MoveOperation.End)
+                self._stream_preview_start = cursor.position()
+                logger.debug(f"Starting streaming reply preview at position {self._stream_preview_start}.")
+            else: # Replace the previous preview text
+                cursor.setPosition(self._stream_preview_start); cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+            model_color = get_color('model', config.APP_THEME)
+            if not isinstance(model_color, QColor): model_color = self.chat_history_display.palette().color(QPalette.ColorRole.Text)
+            prefix_format = QTextCharFormat(); prefix_format.setForeground(model_color); prefix_font = prefix_format.font(); prefix_font.setBold(True); prefix_format.setFont(prefix_font)
+            message_format = QTextCharFormat(); message_format.setForeground(model_color)
+            cursor.insertText("\n", message_format); cursor.insertText("Model: ", prefix_format); cursor.insertText(partial_reply.rstrip(), message_format)
+            if at_bottom: scrollbar.setValue(scrollbar.maximum())
+        except RuntimeError as e: logger.warning(f"Could not update streaming reply preview: {e}")
+        except Exception as e: logger.error("Error updating streaming reply preview.", exc_info=True)
+
+    def clear_streaming_reply_preview(self: 'MainWindow'):
+        """Removes the temporary streaming preview block, if one is shown."""
+        start = self._stream_preview_start
+        if start is None: return
+        self._stream_preview_start = None
+        if self._closing or not self.chat_history_display: return
+        try:
+            document = self.chat_history_display.document()
+            if start >= document.characterCount(): return # Display was cleared meanwhile
+            cursor = QTextCursor(document); cursor.setPosition(start)
+            cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor); cursor.removeSelectedText()
+            logger.debug("Removed streaming reply preview.")
+        except RuntimeError as e: logger.warning(f"Could not remove streaming reply preview: {e}")
+        except Exception as e: logger.error("Error removing streaming reply preview.", exc_info=True)
+
     def add_cli_output(self: 'MainWindow', message_bytes: bytes, message_type: str = "output"):
         """Adds message (decoded) to the CLI output display. Logs the process."""
         # logger.debug(f"Adding CLI output: Type='{message_type}', Bytes={len(message_bytes)}") # Can be very verbose
@@ -449,7 +487,7 @@ class UpdatesMixin:
 
         target_widget = self.cli_output_display
         try:
-            decoded_message = decode_output(message_bytes).rstrip() # Use utility function
+            decoded_message = decode_output_bytes(message_bytes).rstrip() # Signal(bytes) payloads are always bytes
             if not decoded_message: logger.debug("Skipping empty CLI message."); return
             # logger.debug(f"Decoded CLI message: {decoded_message[:150]}...") # Still verbose
         except Exception as decode_err:
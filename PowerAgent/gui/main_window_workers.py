@@ -62,6 +62,7 @@ class WorkersMixin:
             # --- Connect signals ---
             logger.debug("Connecting signals for ApiWorkerThread...")
             self.api_worker_thread.api_result.connect(self.handle_api_result)
+            self.api_worker_thread.api_partial_result.connect(self.show_streaming_reply_preview)
             self.api_worker_thread.cli_output_signal.connect(lambda b: self.add_cli_output(b, "output"))
             self.api_worker_thread.cli_error_signal.connect(lambda b: self.add_cli_output(b, "error"))
             self.api_worker_thread.directory_changed_signal.connect(self.handle_directory_change)
@@ -255,6 +256,7 @@ class WorkersMixin:
         if self._closing: logger.warning(f"Ignoring task finished signal for '{task_type}': application is closing."); return
 
         try:
+            if task_type == "api": self.clear_streaming_reply_preview() # Drop a preview left by a stopped or action-only reply
             # Set UI state to not busy for the completed task type
             self.set_busy_state(False, task_type) # Method logs details
 